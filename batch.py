@@ -0,0 +1,198 @@
+"""
+Generation of many QR codes at once using a pool of worker processes.
+"""
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from constants import EC_LEVEL
+import encoding
+from image import QRImage
+
+OUTPUTS = ("matrix", "png")
+
+# Work per chunk, in modules. Chunks of small symbols hold more messages so the IPC cost stays small compared to the
+# generation time, chunks of large symbols hold less so the work is spread evenly between the workers
+CHUNK_MODULES = 200000
+MAX_CHUNK_SIZE = 256
+
+
+class GenerationError:
+    """
+    Placed in the results instead of the output when a message could not be generated
+    """
+
+    def __init__(self, index: int, error: str):
+        self.index = index
+        self.error = error
+
+    def __repr__(self):
+        return "GenerationError({:d}, {!r})".format(self.index, self.error)
+
+
+class WorkerStats:
+    def __init__(self):
+        self.items = 0
+        self.errors = 0
+        self.seconds = 0.0
+
+    @property
+    def throughput(self) -> float:
+        """
+        Items generated per second of work
+        """
+        return self.items / self.seconds if self.seconds else 0.0
+
+
+class BatchStats:
+    """
+    Per-worker counters, filled while a batch is running. Workers are identified by their process id.
+    """
+
+    def __init__(self):
+        self.workers: Dict[int, WorkerStats] = {}
+
+    def _add(self, pid: int, items: int, errors: int, seconds: float):
+        stats = self.workers.setdefault(pid, WorkerStats())
+        stats.items += items
+        stats.errors += errors
+        stats.seconds += seconds
+
+    @property
+    def items(self) -> int:
+        return sum(stats.items for stats in self.workers.values())
+
+    @property
+    def throughput(self) -> float:
+        """
+        Items generated per second, summed over all the workers
+        """
+        return sum(stats.throughput for stats in self.workers.values())
+
+
+def _render(code: QRImage, output: str):
+    if output == "png":
+        return code.get_png()
+    return code.get_matrix().copy()
+
+
+def _generate_chunk(chunk: List[Tuple[int, encoding.Message]], settings: dict) -> Tuple[int, float, list]:
+    """
+    Generates a chunk of messages in a worker
+
+    :return: A tuple (process id, time spent, results) where results holds an (index, output or GenerationError) tuple
+    per message
+    """
+    start = time.perf_counter()
+    results = []
+    for index, message in chunk:
+        try:
+            code = QRImage(settings["version"], settings["ec_level"], message, **settings["options"])
+            results.append((index, _render(code, settings["output"])))
+        except Exception as e:  # don't lose the worker
+            results.append((index, GenerationError(index, "{}: {}".format(type(e).__name__, e))))
+    return os.getpid(), time.perf_counter() - start, results
+
+
+def _chunk_size(messages: List[encoding.Message], version: Optional[Union[int, str]], ec_level: Union[EC_LEVEL, str],
+                workers: int) -> int:
+    """
+    Picks how many messages are sent to a worker at once based on the size of the symbols
+    """
+    if version in (None, "auto"):
+        # Estimate the version from the first message, the others are usually similar in bulk jobs
+        try:
+            ecl = EC_LEVEL[ec_level] if type(ec_level) is str else ec_level
+            version, _ = encoding.select_version(messages[0], ecl)
+        except Exception:
+            version = 10
+    modules = (version * 4 + 17) ** 2
+
+    size = max(1, min(MAX_CHUNK_SIZE, CHUNK_MODULES // modules))
+    # Keep a few chunks per worker so that a slow chunk doesn't leave the other workers idle at the end
+    return max(1, min(size, len(messages) // (workers * 4)))
+
+
+def generate_many(messages: Iterable[encoding.Message], version: Optional[Union[int, str]] = None,
+                  ec_level: Union[EC_LEVEL, str] = EC_LEVEL.L, workers: Optional[int] = None, output: str = "matrix",
+                  ordered: bool = True, chunk_size: Optional[int] = None, stats: Optional[BatchStats] = None,
+                  max_chunks_in_flight: Optional[int] = None, **options) -> Union[list, Iterator[tuple]]:
+    """
+    Generates a QR code for every message using a pool of processes
+
+    :param messages: The messages to encode, text or binary payloads
+    :param version: The QR version to use, None or "auto" to select it for each message
+    :param ec_level: The error correction level to use
+    :param workers: The number of worker processes, defaults to the number of CPUs. 1 generates in this process
+    :param output: "matrix" for the module matrix as a uint8 array, "png" for PNG encoded bytes
+    :param ordered: If True, return a list in the order of messages. Otherwise return an iterator of (index, result)
+    tuples in completion order
+    :param chunk_size: The number of messages sent to a worker at once, picked from the symbol size by default
+    :param stats: If given, filled with the per-worker counters
+    :param max_chunks_in_flight: The maximum number of chunks sent to the workers whose results weren't returned yet,
+    2 per worker by default. Bounds the memory held by the outputs in unordered mode
+    :param options: Other arguments passed to QRImage (mask, mask_policy, score_backend, use_cache, ...). Each worker
+    process has its own symbol cache
+    :return: The outputs, a GenerationError replaces the output of every message that failed
+    """
+    if output not in OUTPUTS:
+        raise ValueError("Unknown output, must be one of " + ", ".join(OUTPUTS))
+
+    messages = list(messages)
+    workers = workers or os.cpu_count() or 1
+    if chunk_size is None:
+        chunk_size = _chunk_size(messages, version, ec_level, workers) if messages else 1
+    if stats is None:
+        stats = BatchStats()
+
+    settings = {"version": version, "ec_level": ec_level, "output": output, "options": options}
+    indexed = list(enumerate(messages))
+    chunks = [indexed[i:i + chunk_size] for i in range(0, len(indexed), chunk_size)]
+    iterator = _run(chunks, settings, workers, max_chunks_in_flight or workers * 2, stats)
+
+    if not ordered:
+        return iterator
+
+    results: list = [None] * len(messages)
+    for index, result in iterator:
+        results[index] = result
+    return results
+
+
+def _run(chunks: List[List[Tuple[int, str]]], settings: dict, workers: int, max_in_flight: int,
+         stats: BatchStats) -> Iterator[tuple]:
+    def collect(pid: int, seconds: float, results: list):
+        errors = sum(1 for _, result in results if isinstance(result, GenerationError))
+        stats._add(pid, len(results) - errors, errors, seconds)
+        return results
+
+    if workers == 1:
+        for chunk in chunks:
+            yield from collect(*_generate_chunk(chunk, settings))
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending: Dict[Future, list] = {}
+
+        def finish(future: Future) -> list:
+            chunk = pending.pop(future)  # the future and its results are dropped once yielded
+            try:
+                outcome = future.result()
+            except Exception as e:
+                # The worker died (or the results couldn't be sent back), every message of the chunk failed
+                error = "{}: {}".format(type(e).__name__, e)
+                return [(index, GenerationError(index, error)) for index, _ in chunk]
+            return collect(*outcome)
+
+        # Chunks are submitted when others complete so that at most max_in_flight of them hold results at once
+        remaining = iter(chunks)
+        while True:
+            for chunk in islice(remaining, max_in_flight - len(pending)):
+                pending[executor.submit(_generate_chunk, chunk, settings)] = chunk
+            if not pending:
+                return
+            done = wait(pending, return_when=FIRST_COMPLETED).done
+            while done:
+                yield from finish(done.pop())
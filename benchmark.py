@@ -0,0 +1,317 @@
+"""
+Small benchmarks for the performance sensitive parts of the library.
+
+Usage: python benchmark.py [name ...]
+Runs every benchmark when no name is given.
+"""
+import io
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import timeit
+import tracemalloc
+from typing import Tuple
+
+import numpy
+from PIL import Image
+
+import bitboard
+from constants import DATA_MODE, EC_LEVEL
+import encoding
+import image
+from image import QRImage
+from matrix import MaskSearchStats, search_masks
+from penalty import penalty_scores
+import rs
+
+
+def _report(label: str, seconds: float, number: int):
+    print("{:<52s} {:>10.1f} us/op".format(label, seconds * 1e6 / number))
+
+
+def bench_rs():
+    """
+    Compare the shift-register RS encoder against the polynomial division reference on version 40-H blocks
+    """
+    block = bytes(random.randrange(256) for _ in range(16))  # 40-H blocks hold 15 or 16 data codewords
+    rs.create_ecc_block(block, 30)  # build the tables outside of the timing
+
+    number = 2000
+    reference = timeit.timeit(lambda: rs.create_ecc_block_reference(block, 30), number=number)
+    lfsr = timeit.timeit(lambda: rs.create_ecc_block(block, 30), number=number)
+    _report("rs reference (40-H block)", reference, number)
+    _report("rs lfsr (40-H block)", lfsr, number)
+
+    long_block = bytes(random.randrange(256) for _ in range(120))
+    rs.create_ecc_block(long_block, 68)
+    reference = timeit.timeit(lambda: rs.create_ecc_block_reference(long_block, 68), number=number // 10)
+    lfsr = timeit.timeit(lambda: rs.create_ecc_block(long_block, 68), number=number // 10)
+    _report("rs reference (120 data, 68 ecc)", reference, number // 10)
+    _report("rs lfsr (120 data, 68 ecc)", lfsr, number // 10)
+
+
+def bench_rs_batch():
+    """
+    Compare encoding many version 40-H blocks one at a time against the vectorized batch encoder
+    """
+    blocks = numpy.random.randint(0, 256, (10000, 16), dtype=numpy.uint8)
+    rows = [bytes(row) for row in blocks]
+    rs.create_ecc_blocks(blocks[:1], 30)
+
+    number = 3
+    single = timeit.timeit(lambda: [rs.create_ecc_block(row, 30) for row in rows], number=number)
+    batch = timeit.timeit(lambda: rs.create_ecc_blocks(blocks, 30), number=number)
+    _report("rs lfsr, 10000 blocks one by one", single, number)
+    _report("rs batch, 10000 blocks", batch, number)
+
+    messages = ["https://example.com/item/{:08d}".format(i) for i in range(2000)]
+    for version in [10, 25]:  # the batch gain grows with the share of padding codewords
+        single = timeit.timeit(lambda: [encoding.generate_codewords(m, version, EC_LEVEL.H) for m in messages],
+                               number=number)
+        batch = timeit.timeit(lambda: encoding.generate_codewords_batch(messages, version, EC_LEVEL.H), number=number)
+        _report("generate_codewords, 2000 messages ({:d}-H)".format(version), single, number)
+        _report("generate_codewords_batch, 2000 messages ({:d}-H)".format(version), batch, number)
+
+
+def bench_mask_score():
+    """
+    Compare the list based reference scorer against the vectorized scorer on the 8 candidates of a version 40 symbol
+    """
+    code = QRImage(40, "L", "x" * 1000)
+    candidates = (numpy.random.rand(8, code._size, code._size) < 0.5).astype(numpy.uint8)
+    lists = [candidate.tolist() for candidate in candidates]
+
+    number = 3
+    reference = timeit.timeit(lambda: [code._calculate_mask_score(array) for array in lists], number=number)
+    vectorized = timeit.timeit(lambda: penalty_scores(candidates), number=number)
+    _report("mask score reference, 8 candidates (v40)", reference, number)
+    _report("mask score numpy, 8 candidates (v40)", vectorized, number)
+
+
+def bench_bitboard():
+    """
+    Cross-check the bitboard scorer against the list based reference scorer and compare their speed for versions 1-40
+    """
+    code = QRImage(1, "L", "bench")
+    number = 3
+    for version in range(1, 41):
+        size = version * 4 + 17
+        code._size = size  # the reference scorer only reads the size from the instance
+        matrix = (numpy.random.rand(size, size) < 0.5).astype(numpy.uint8)
+        lists = matrix.tolist()
+        modules = matrix.tobytes()
+
+        rows, cols = bitboard.from_modules(modules, size)
+        assert sum(bitboard.penalty_scores(rows, cols, size)) == code._calculate_mask_score(lists)
+
+        reference = timeit.timeit(lambda: code._calculate_mask_score(lists), number=number)
+        boards = timeit.timeit(lambda: bitboard.penalty_scores(*bitboard.from_modules(modules, size), size),
+                               number=number)
+        print("v{:<3d} reference {:>10.1f} us   bitboard {:>8.1f} us   x{:.0f}".format(
+            version, reference * 1e6 / number, boards * 1e6 / number, reference / boards))
+
+
+def bench_mask_search():
+    """
+    Compare scoring every rule of the 8 candidates against the branch and bound mask search, and count the skipped work.
+    Both start from the unmasked matrix, building the candidates is timed too
+    """
+    number = 10
+    for version in [2, 10, 25, 40]:
+        codes = [QRImage(version, "L", "mask search {:d}".format(i), use_cache=False) for i in range(number)]
+        stats = []
+
+        def exhaustive_search():
+            return [int(penalty_scores(code._mask_candidates()).sum(axis=1).argmin()) for code in codes]
+
+        def pruned_search():
+            stats[:] = [MaskSearchStats() for _ in codes]
+            return [search_masks(image._candidate_score_rule(code._mask_candidates()), stats[i])[0]
+                    for i, code in enumerate(codes)]
+
+        assert exhaustive_search() == pruned_search() == [code.get_mask() for code in codes]
+        exhaustive = min(timeit.repeat(exhaustive_search, number=1, repeat=3))
+        pruned = min(timeit.repeat(pruned_search, number=1, repeat=3))
+        skipped = sum(search.skipped_rules for search in stats)
+        used = "branch and bound" if version >= image.PRUNED_SEARCH_VERSION else "exhaustive"
+        _report("mask search exhaustive (v{:d})".format(version), exhaustive, number)
+        _report("mask search branch and bound (v{:d}, {:.0%} skipped)".format(
+            version, skipped / (32 * number)), pruned, number)
+        print("  QRImage uses the {} search at v{:d}".format(used, version))
+
+
+def bench_mask_policies():
+    """
+    Compare the time and the penalty of the chosen masks of every mask policy, the penalty increase is measured against
+    the exhaustive search
+    """
+    number = 20
+    for version in [5, 20, 40]:
+        messages = ["policy {:d}".format(i) for i in range(number)]
+        optimal = [QRImage(version, "L", m, use_cache=False).get_mask_search_stats().score for m in messages]
+        for policy in ["exhaustive", "sampled", "heuristic"]:
+            codes = []
+            seconds = timeit.timeit(lambda: codes.extend(
+                QRImage(version, "L", m, use_cache=False, mask_policy=policy) for m in messages), number=1)
+            scores = [code.get_mask_search_stats().score for code in codes]
+            worse = sum(score > best for score, best in zip(scores, optimal))
+            loss = sum(scores) / sum(optimal) - 1
+            _report("{} (v{:d}, {:d}/{:d} worse, +{:.1%} penalty)".format(policy, version, worse, number, loss),
+                    seconds, number)
+
+
+def _kron_image(code: QRImage) -> Image.Image:
+    """
+    The renderer used before the integer upscaling one, kept as a baseline
+    """
+    np_array = [[255 if i != 1 else 0 for i in row] for row in code.get_matrix()]
+    np_array = numpy.kron(np_array, numpy.ones((20, 20)))
+    return Image.fromarray(np_array.astype(numpy.uint8), mode='L')
+
+
+def bench_render():
+    """
+    Compare the time and peak memory of the numpy.kron float renderer against the integer upscaling renderer. Peaks
+    only count python and numpy allocations, the buffer of the PIL image itself is not traced
+    """
+    number = 3
+
+    def peak(render) -> int:
+        tracemalloc.start()
+        render()
+        _, peak_bytes = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return peak_bytes
+
+    for version in [10, 40]:
+        code = QRImage(version, "L", "render", use_cache=False)
+        bilevel = QRImage(version, "L", "render", use_cache=False, image_mode="1")
+        renderers = [
+            ("kron float64", lambda: _kron_image(code)),
+            ("uint8 'L'", code._generate_image),
+            ("1-bit '1'", bilevel._generate_image),
+        ]
+        for name, render in renderers:
+            seconds = timeit.timeit(render, number=number)
+            _report("render {} (v{:d}, {:.1f} MB peak)".format(name, version, peak(render) / 1e6), seconds, number)
+
+
+def bench_vector():
+    """
+    Compare the size and speed of SVG and PDF output against PNG output, from already built symbols
+    """
+    number = 20
+    for version in [5, 20, 40]:
+        codes = [QRImage(version, "L", "vector {:d}".format(i), use_cache=False, module_size=4, quiet_zone=4)
+                 for i in range(number)]
+        writers = [
+            ("svg", lambda code, out: code.write_svg(out), io.StringIO),
+            ("pdf", lambda code, out: code.write_pdf(out), io.BytesIO),
+            ("png (PIL)", lambda code, out: out.write(code.get_png()), io.BytesIO),
+            ("png (streamed, 1-bit)", lambda code, out: code.write_png(out, bit_depth=1), io.BytesIO),
+        ]
+        for name, write, buffer in writers:
+            sizes = []
+            seconds = timeit.timeit(lambda: sizes.extend(write(code, buffer()) for code in codes), number=1)
+            _report("{} (v{:d}, {:.0f} bytes, {:.0f} symbols/s)".format(
+                name, version, sum(sizes) / number, number / seconds), seconds, number)
+
+
+# Cumulative import time allowed for the stdlib-only modules, in seconds. Guards the cold start of workers that only
+# need codewords or module matrices
+STARTUP_BUDGET = 0.05
+
+
+def _import_profile(module: str, cache_dir: str) -> Tuple[float, set]:
+    """
+    Imports a module in a new interpreter with -X importtime
+
+    :return: A tuple (cumulative import time in seconds, names of the top-level packages imported)
+    """
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)  # measure with compiled bytecode, like a deployed worker
+    result = subprocess.run([sys.executable, "-X", "importtime", "-X", "pycache_prefix=" + cache_dir, "-c",
+                             "import " + module], cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+                            stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    seconds = 0.0
+    packages = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        packages.add(name.strip().split(".")[0])
+        if name.strip() == module and not name[1:].startswith(" "):
+            seconds = int(cumulative) / 1e6
+    return seconds, packages
+
+
+def bench_startup():
+    """
+    Measure the import time of the encode -> matrix path and of image.py. The matrix path must not import numpy or PIL
+    and must stay under STARTUP_BUDGET
+    """
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for module in ["encoding", "matrix", "image"]:
+            _import_profile(module, cache_dir)  # compile the bytecode
+            seconds, packages = min((_import_profile(module, cache_dir) for _ in range(5)), key=lambda r: r[0])
+            heavy = sorted(packages & {"numpy", "PIL"})
+            print("import {:<10s} {:>8.1f} ms   {}".format(module, seconds * 1e3, ", ".join(heavy) or "stdlib only"))
+            if module != "image":
+                assert not heavy, module + " imports " + ", ".join(heavy)
+                assert seconds < STARTUP_BUDGET, "{} takes {:.1f} ms to import".format(module, seconds * 1e3)
+
+
+def bench_segments():
+    """
+    Compare the smallest version needed with a single data mode and with optimal segmentation on mixed payloads
+    """
+    payloads = [
+        "https://shop.example.com/p/00123456789012345678",
+        "https://example.com/track?id=8837465512093847562910",
+        "SN-XK-2023-000184736291",
+        "sn-xk-2023-000184736291",
+        "Order 31415926535897932384626433 for john.doe",
+        "LOT:A7/2024-11-05 QTY:000120 ref=b8f1",
+        "WIFI:S:home;T:WPA;P:0123456789012345;;",
+        "tel:+15550000000000000000000000000000",
+        "品番：ＡＢＣー１２３　東京都千代田区",
+        "商品コード 4901234567894 数量 12",
+    ]
+    for ec in [EC_LEVEL.L, EC_LEVEL.H]:
+        for payload in payloads:
+            mode = encoding.optimal_data_mode(payload)
+            try:
+                single = [(mode, encoding.encode(payload, mode))]
+            except encoding.EncodingError:
+                # Text without a single mode is written as UTF-8
+                single = [(DATA_MODE.ECI, [encoding.ECI_UTF8]), (DATA_MODE.Byte, payload.encode("utf-8"))]
+            single_version = encoding._smallest_version(lambda v: encoding._segments_bit_length(single, v), ec)
+            segmented_version, _ = encoding.select_version(payload, ec)
+            print("{} {:<52s} single mode v{:<3d} segmented v{:<3d}".format(
+                ec.name, payload, single_version, segmented_version))
+
+    number = 200
+    payload = payloads[1]
+    _report("segment_data (52 chars)", timeit.timeit(lambda: encoding.segment_data(payload, 5), number=number), number)
+
+
+BENCHMARKS = {
+    "rs": bench_rs,
+    "rs_batch": bench_rs_batch,
+    "mask_score": bench_mask_score,
+    "bitboard": bench_bitboard,
+    "mask_search": bench_mask_search,
+    "mask_policies": bench_mask_policies,
+    "render": bench_render,
+    "vector": bench_vector,
+    "startup": bench_startup,
+    "segments": bench_segments,
+}
+
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        BENCHMARKS[name]()
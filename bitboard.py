@@ -0,0 +1,133 @@
+"""
+Mask penalty scoring on bitboards, using only the standard library.
+
+A bitboard packs a whole matrix in a single int: module (y, x) is bit y * (size + 1) + x. The extra bit at the end of
+each row is a guard that is always 0 and is masked out of every comparison, so runs and patterns never span two rows.
+The same layout is used for columns by packing the transposed matrix, the penalty rules then become shifts, ands and
+popcounts over the whole board.
+"""
+from typing import Dict, Tuple
+
+# Maps module values (0 or 1) to the ascii digits parsed by int(..., 2)
+_DIGITS = bytes.maketrans(b"\x00\x01", b"01")
+
+# Bits of the finder-like patterns, from the first module of the window to the last
+_FINDER_BEFORE = (0, 0, 0, 0, 1, 0, 1, 1, 1, 0, 1)
+_FINDER_AFTER = (1, 0, 1, 1, 1, 0, 1, 0, 0, 0, 0)
+
+_line_masks: Dict[Tuple[int, int, int], int] = {}
+
+
+def _line_mask(size: int, width: int, lines: int = None) -> int:
+    """
+    Returns a board with the first `width` bits of the first `lines` lines set (all lines by default)
+    """
+    lines = size if lines is None else lines
+    key = (size, width, lines)
+    if key not in _line_masks:
+        line = (1 << width) - 1
+        mask = 0
+        for i in range(lines):
+            mask |= line << (i * (size + 1))
+        _line_masks[key] = mask
+    return _line_masks[key]
+
+
+def _popcount(board: int) -> int:
+    return bin(board).count("1")
+
+
+def from_modules(modules: bytes, size: int) -> Tuple[int, int]:
+    """
+    Packs a matrix into its row and column bitboards
+
+    :param modules: The modules (0 or 1) of the matrix in row-major order, size * size bytes
+    :param size: The width of the matrix
+    :return: A tuple (rows, columns) of bitboards
+    """
+    modules = bytes(modules)
+    rows = b"\x00".join(modules[y * size:(y + 1) * size] for y in range(size)) + b"\x00"
+    cols = b"\x00".join(modules[x::size] for x in range(size)) + b"\x00"
+
+    # int() reads the most significant bit first, reverse so the first module ends up as bit 0
+    return int(rows[::-1].translate(_DIGITS), 2), int(cols[::-1].translate(_DIGITS), 2)
+
+
+def _runs(board: int, size: int) -> int:
+    """
+    N1: 3 + (length - 5) points for every run of 5+ same colored modules in a line
+    """
+    # Bit i is set when module i and i + 1 are the same color
+    same = ~(board ^ (board >> 1)) & _line_mask(size, size - 1)
+    # Bit i is set when modules i to i + 4 are the same color, a run of length L sets L - 4 consecutive bits
+    windows = same & (same >> 1) & (same >> 2) & (same >> 3)
+    # One start bit per run
+    starts = windows & ~(windows << 1)
+
+    # (L - 4) + 2 = 3 + (L - 5) for every run
+    return _popcount(windows) + 2 * _popcount(starts)
+
+
+def _boxes(board: int, size: int) -> int:
+    """
+    N2: 3 points for every 2x2 block of same colored modules
+    """
+    stride = size + 1
+    horizontal = ~(board ^ (board >> 1))  # (y, x) same as (y, x + 1)
+    vertical = ~(board ^ (board >> stride))  # (y, x) same as (y + 1, x)
+    boxes = horizontal & vertical & (horizontal >> stride) & _line_mask(size, size - 1, size - 1)
+    return _popcount(boxes) * 3
+
+
+def _finder_like(board: int, size: int) -> int:
+    """
+    N3: 40 points for every finder-like pattern in a line
+    """
+    windows = _line_mask(size, size - 10)  # start positions of the 11 module windows
+    before = after = windows
+    for offset in range(11):
+        shifted = board >> offset
+        before &= shifted if _FINDER_BEFORE[offset] else ~shifted
+        after &= shifted if _FINDER_AFTER[offset] else ~shifted
+    return (_popcount(before) + _popcount(after)) * 40
+
+
+def _proportion(board: int, size: int) -> int:
+    """
+    N4: 10 points for every 5% step the proportion of dark modules deviates from 50%
+    """
+    total = size * size
+    deviation = abs(_popcount(board) * 100 - total * 50)
+    return max(0, -(-deviation // (5 * total)) - 1) * 10
+
+
+def rule_score(rows: int, cols: int, size: int, rule: int) -> int:
+    """
+    Scores a single penalty rule of a masked matrix from its bitboards
+
+    :param rule: The rule to evaluate, 0 to 3 for N1 to N4
+    """
+    if rule == 0:
+        return _runs(rows, size) + _runs(cols, size)
+    if rule == 1:
+        return _boxes(rows, size)
+    if rule == 2:
+        return _finder_like(rows, size) + _finder_like(cols, size)
+    return _proportion(rows, size)
+
+
+def penalty_scores(rows: int, cols: int, size: int) -> Tuple[int, int, int, int]:
+    """
+    Scores a masked matrix from its bitboards
+
+    :param rows: The row bitboard
+    :param cols: The column bitboard
+    :param size: The width of the matrix
+    :return: A tuple with the N1, N2, N3 and N4 penalties
+    """
+    return (
+        _runs(rows, size) + _runs(cols, size),
+        _boxes(rows, size),
+        _finder_like(rows, size) + _finder_like(cols, size),
+        _proportion(rows, size),
+    )
@@ -0,0 +1,66 @@
+class BitStream:
+    """
+    Append-only bit buffer backed by a bytearray. Bits are written MSB-first, which is the order used by the QR standard
+    for every field of the data stream (mode indicator, CCI, data groups, padding).
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._length = 0  # number of bits written
+        self._acc = 0  # bits not yet flushed to _buffer
+        self._acc_length = 0
+
+    def __len__(self) -> int:
+        return self._length
+
+    def append(self, value: int, length: int):
+        """
+        Append the `length` least significant bits of value to the stream
+
+        :param value: The value to write
+        :param length: The number of bits to write
+        """
+        if length <= 0:
+            return
+
+        self._acc = (self._acc << length) | (value & ((1 << length) - 1))
+        self._acc_length += length
+        self._length += length
+
+        # flush every complete byte to the buffer
+        while self._acc_length >= 8:
+            self._acc_length -= 8
+            self._buffer.append((self._acc >> self._acc_length) & 0xFF)
+        self._acc &= (1 << self._acc_length) - 1
+
+    def extend_bytes(self, data: bytes):
+        """
+        Append whole bytes to the stream
+
+        :param data: A bytes-like object to append
+        """
+        if self._acc_length == 0:
+            # byte aligned, no shifting needed
+            self._buffer += data
+            self._length += len(data) * 8
+        elif data:
+            # Shift the whole buffer at once behind the pending bits, the last bits stay pending
+            value = (self._acc << (len(data) * 8)) | int.from_bytes(data, "big")
+            self._buffer += (value >> self._acc_length).to_bytes(len(data), "big")
+            self._acc = value & ((1 << self._acc_length) - 1)
+            self._length += len(data) * 8
+
+    def pad_to_byte(self):
+        """
+        Append 0s until the stream length is a multiple of 8
+        """
+        if self._acc_length:
+            self.append(0, 8 - self._acc_length)
+
+    def to_bytes(self) -> bytes:
+        """
+        Returns the content of the stream as bytes, the last byte being padded with 0s if needed
+        """
+        if self._acc_length:
+            return bytes(self._buffer) + bytes([(self._acc << (8 - self._acc_length)) & 0xFF])
+        return bytes(self._buffer)
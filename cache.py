@@ -0,0 +1,125 @@
+"""
+Process-wide cache of generated symbols, so that codes requested over and over are only built once.
+
+The cache has two layers: `matrices` holds the final module matrix of a symbol (with what is needed to re-mask it) and
+`renders` holds rendered image bytes per render configuration. Both layers are LRU caches bounded by a number of
+entries and a number of bytes, and are safe to use from several threads.
+"""
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+# Default bounds of each layer
+MAX_ENTRIES = 4096
+MAX_BYTES = 64 * 1024 * 1024
+
+
+class CacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __repr__(self):
+        return "CacheStats(hits={:d}, misses={:d}, evictions={:d})".format(self.hits, self.misses, self.evictions)
+
+
+class LRUCache:
+    """
+    Thread-safe mapping evicting the least recently used entries once it holds more than `max_entries` entries or
+    `max_bytes` bytes. The size of an entry is given by the caller when it is added.
+    """
+
+    def __init__(self, max_entries: int = MAX_ENTRIES, max_bytes: int = MAX_BYTES):
+        self._entries: OrderedDict = OrderedDict()  # key -> (value, size), least recently used first
+        self._lock = threading.Lock()
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self.bytes = 0
+        self.stats = CacheStats()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Returns the value of the key and marks it as recently used, None if the key is not cached
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any, size: int):
+        """
+        Adds or replaces a key. A value larger than the byte budget is not cached.
+
+        :param size: The size of the value in bytes
+        """
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            if size > self._max_bytes or self._max_entries < 1:
+                return
+            self._entries[key] = (value, size)
+            self.bytes += size
+            self._evict()
+
+    def configure(self, max_entries: Optional[int] = None, max_bytes: Optional[int] = None):
+        """
+        Changes the bounds of the cache, evicting entries if needed
+        """
+        with self._lock:
+            if max_entries is not None:
+                self._max_entries = max_entries
+            if max_bytes is not None:
+                self._max_bytes = max_bytes
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self._max_entries or self.bytes > self._max_bytes):
+            _, (_, size) = self._entries.popitem(last=False)
+            self.bytes -= size
+            self.stats.evictions += 1
+
+
+# Final matrices, keyed by the settings the symbol depends on (message, version, EC level, mask, ...)
+matrices = LRUCache()
+# Rendered image bytes, keyed by (symbol key, render configuration)
+renders = LRUCache()
+
+
+def configure(max_entries: Optional[int] = None, max_bytes: Optional[int] = None, layer: Optional[str] = None):
+    """
+    Changes the bounds of a cache layer ("matrices" or "renders"), or of both layers when no layer is given. A bound of
+    0 disables the layer.
+    """
+    layers = {"matrices": matrices, "renders": renders}
+    if layer is not None and layer not in layers:
+        raise ValueError("Unknown cache layer, must be one of " + ", ".join(layers))
+    for name, cache in layers.items():
+        if layer is None or layer == name:
+            cache.configure(max_entries, max_bytes)
+
+
+def clear():
+    """
+    Empties both layers. Statistics are kept
+    """
+    matrices.clear()
+    renders.clear()
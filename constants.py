@@ -101,32 +101,32 @@ ALIGNMENT_POSITIONS = [
     [(4, 30), (30, 56), (30, 30), (30, 4), (56, 56), (56, 30)],
     [(4, 32), (32, 60), (32, 32), (32, 4), (60, 60), (60, 32)],
     [(4, 44), (4, 24), (24, 64), (24, 44), (24, 24), (24, 4), (44, 64), (44, 44), (44, 24), (44, 4), (64, 64), (64, 44), (64, 24)],
-    [(4, 48), (4, 26), (24, 68), (24, 48), (24, 26), (24, 4), (46, 68), (46, 48), (46, 26), (46, 4), (68, 68), (68, 48), (68, 26)],  # v15
-    [(4, 52), (4, 28), (24, 72), (24, 52), (24, 28), (24, 4), (48, 72), (48, 52), (48, 28), (48, 4), (72, 72), (72, 52), (72, 28)],
+    [(4, 46), (4, 24), (24, 68), (24, 46), (24, 24), (24, 4), (46, 68), (46, 46), (46, 24), (46, 4), (68, 68), (68, 46), (68, 24)],  # v15
+    [(4, 48), (4, 24), (24, 72), (24, 48), (24, 24), (24, 4), (48, 72), (48, 48), (48, 24), (48, 4), (72, 72), (72, 48), (72, 24)],
     [(4, 52), (4, 28), (28, 76), (28, 52), (28, 28), (28, 4), (52, 76), (52, 52), (52, 28), (52, 4), (76, 76), (76, 52), (76, 28)],
-    [(4, 56), (4, 30), (28, 80), (28, 56), (28, 30), (28, 2), (54, 80), (54, 56), (54, 30), (54, 2), (82, 80), (82, 56), (82, 30)],
-    [(4, 60), (4, 32), (28, 84), (28, 60), (28, 32), (28, 4), (56, 84), (56, 60), (56, 32), (56, 4), (84, 84), (84, 60), (84, 32)],
+    [(4, 54), (4, 28), (28, 80), (28, 54), (28, 28), (28, 4), (54, 80), (54, 54), (54, 28), (54, 4), (80, 80), (80, 54), (80, 28)],
+    [(4, 56), (4, 28), (28, 84), (28, 56), (28, 28), (28, 4), (56, 84), (56, 56), (56, 28), (56, 4), (84, 84), (84, 56), (84, 28)],
     [(4, 60), (4, 32), (32, 88), (32, 60), (32, 32), (32, 4), (60, 88), (60, 60), (60, 32), (60, 4), (88, 88), (88, 60), (88, 32)],  # v20
-    [(4, 70), (4, 44), (4, 26), (26, 92), (26, 70), (26, 44), (26, 26), (26, 4), (52, 92), (52, 70), (52, 44), (52, 26), (52, 4), (70, 92), (70, 70), (70, 44), (70, 26), (70, 4), (92, 92), (92, 70), (92, 44), (92, 26)],
-    [(4, 76), (4, 52), (4, 28), (24, 96), (24, 76), (24, 52), (24, 28), (24, 4), (48, 96), (48, 76), (48, 52), (48, 28), (48, 4), (72, 96), (72, 76), (72, 52), (72, 28), (72, 4), (96, 96), (96, 76), (96, 52), (96, 28)],
+    [(4, 70), (4, 48), (4, 26), (26, 92), (26, 70), (26, 48), (26, 26), (26, 4), (48, 92), (48, 70), (48, 48), (48, 26), (48, 4), (70, 92), (70, 70), (70, 48), (70, 26), (70, 4), (92, 92), (92, 70), (92, 48), (92, 26)],
+    [(4, 72), (4, 48), (4, 24), (24, 96), (24, 72), (24, 48), (24, 24), (24, 4), (48, 96), (48, 72), (48, 48), (48, 24), (48, 4), (72, 96), (72, 72), (72, 48), (72, 24), (72, 4), (96, 96), (96, 72), (96, 48), (96, 24)],
     [(4, 76), (4, 52), (4, 28), (28, 100), (28, 76), (28, 52), (28, 28), (28, 4), (52, 100), (52, 76), (52, 52), (52, 28), (52, 4), (76, 100), (76, 76), (76, 52), (76, 28), (76, 4), (100, 100), (100, 76), (100, 52), (100, 28)],
-    [(4, 82), (4, 56), (4, 30), (26, 104), (26, 82), (26, 56), (26, 30), (26, 4), (52, 104), (52, 82), (52, 56), (52, 30), (52, 4), (78, 104), (78, 82), (78, 56), (78, 30), (78, 4), (104, 104), (104, 82), (104, 56), (104, 30)],
+    [(4, 78), (4, 52), (4, 26), (26, 104), (26, 78), (26, 52), (26, 26), (26, 4), (52, 104), (52, 78), (52, 52), (52, 26), (52, 4), (78, 104), (78, 78), (78, 52), (78, 26), (78, 4), (104, 104), (104, 78), (104, 52), (104, 26)],
     [(4, 82), (4, 56), (4, 30), (30, 108), (30, 82), (30, 56), (30, 30), (30, 4), (56, 108), (56, 82), (56, 56), (56, 30), (56, 4), (82, 108), (82, 82), (82, 56), (82, 30), (82, 4), (108, 108), (108, 82), (108, 56), (108, 30)],  # v25
-    [(4, 88), (4, 60), (4, 32), (28, 112), (28, 88), (28, 60), (28, 32), (28, 4), (56, 112), (56, 88), (56, 60), (56, 32), (56, 4), (84, 112), (84, 88), (84, 60), (84, 32), (84, 4), (112, 112), (112, 88), (112, 60), (112, 32)],
+    [(4, 84), (4, 56), (4, 28), (28, 112), (28, 84), (28, 56), (28, 28), (28, 4), (56, 112), (56, 84), (56, 56), (56, 28), (56, 4), (84, 112), (84, 84), (84, 56), (84, 28), (84, 4), (112, 112), (112, 84), (112, 56), (112, 28)],
     [(4, 88), (4, 60), (4, 32), (32, 116), (32, 88), (32, 60), (32, 32), (32, 4), (60, 116), (60, 88), (60, 60), (60, 32), (60, 4), (88, 116), (88, 88), (88, 60), (88, 32), (88, 4), (116, 116), (116, 88), (116, 60), (116, 32)],
-    [(4, 100), (4, 76), (4, 52), (4, 28), (24, 120), (24, 100), (24, 76), (24, 52), (24, 28), (24, 4), (48, 120), (48, 100), (48, 76), (48, 52), (48, 28), (48, 4), (72, 120), (72, 100), (72, 76), (72, 52), (72, 28), (72, 4), (96, 120), (96, 100), (96, 76), (96, 52), (96, 28), (96, 4), (120, 120), (120, 100), (120, 76), (120, 52), (120, 28)],
+    [(4, 96), (4, 72), (4, 48), (4, 24), (24, 120), (24, 96), (24, 72), (24, 48), (24, 24), (24, 4), (48, 120), (48, 96), (48, 72), (48, 48), (48, 24), (48, 4), (72, 120), (72, 96), (72, 72), (72, 48), (72, 24), (72, 4), (96, 120), (96, 96), (96, 72), (96, 48), (96, 24), (96, 4), (120, 120), (120, 96), (120, 72), (120, 48), (120, 24)],
     [(4, 100), (4, 76), (4, 52), (4, 28), (28, 124), (28, 100), (28, 76), (28, 52), (28, 28), (28, 4), (52, 124), (52, 100), (52, 76), (52, 52), (52, 28), (52, 4), (76, 124), (76, 100), (76, 76), (76, 52), (76, 28), (76, 4), (100, 124), (100, 100), (100, 76), (100, 52), (100, 28), (100, 4), (124, 124), (124, 100), (124, 76), (124, 52), (124, 28)],
-    [(4, 108), (4, 82), (4, 56), (4, 30), (24, 128), (24, 108), (24, 82), (24, 56), (24, 30), (24, 4), (50, 128), (50, 108), (50, 82), (50, 56), (50, 30), (50, 4), (76, 128), (76, 108), (76, 82), (76, 56), (76, 30), (76, 4), (102, 128), (102, 108), (102, 82), (102, 56), (102, 30), (102, 4), (128, 128), (128, 108), (128, 82), (128, 56), (128, 30)],  # v30
-    [(4, 108), (4, 82), (4, 56), (4, 30), (28, 132), (28, 108), (28, 82), (28, 56), (28, 30), (28, 4), (54, 132), (54, 108), (54, 82), (54, 56), (54, 30), (54, 4), (80, 132), (80, 108), (80, 82), (80, 56), (80, 30), (80, 4), (106, 132), (106, 108), (106, 82), (106, 56), (106, 30), (106, 4), (132, 132), (132, 108), (132, 82), (132, 56), (132, 30)],
-    [(4, 108), (4, 82), (4, 56), (4, 30), (32, 136), (32, 108), (32, 82), (32, 56), (32, 30), (32, 4), (58, 136), (58, 108), (58, 82), (58, 56), (58, 30), (58, 4), (84, 136), (84, 108), (84, 82), (84, 56), (84, 30), (84, 4), (110, 136), (110, 108), (110, 82), (110, 56), (110, 30), (110, 4), (136, 136), (136, 108), (136, 82), (136, 56), (136, 30)],
-    [(4, 116), (4, 88), (4, 60), (4, 32), (28, 140), (28, 116), (28, 88), (28, 60), (28, 32), (28, 4), (56, 140), (56, 116), (56, 88), (56, 60), (56, 32), (56, 4), (84, 140), (84, 116), (84, 88), (84, 60), (84, 32), (84, 4), (112, 140), (112, 116), (112, 88), (112, 60), (112, 32), (112, 4), (140, 140), (140, 116), (140, 88), (140, 60), (140, 32)],
+    [(4, 102), (4, 76), (4, 50), (4, 24), (24, 128), (24, 102), (24, 76), (24, 50), (24, 24), (24, 4), (50, 128), (50, 102), (50, 76), (50, 50), (50, 24), (50, 4), (76, 128), (76, 102), (76, 76), (76, 50), (76, 24), (76, 4), (102, 128), (102, 102), (102, 76), (102, 50), (102, 24), (102, 4), (128, 128), (128, 102), (128, 76), (128, 50), (128, 24)],  # v30
+    [(4, 106), (4, 80), (4, 54), (4, 28), (28, 132), (28, 106), (28, 80), (28, 54), (28, 28), (28, 4), (54, 132), (54, 106), (54, 80), (54, 54), (54, 28), (54, 4), (80, 132), (80, 106), (80, 80), (80, 54), (80, 28), (80, 4), (106, 132), (106, 106), (106, 80), (106, 54), (106, 28), (106, 4), (132, 132), (132, 106), (132, 80), (132, 54), (132, 28)],
+    [(4, 110), (4, 84), (4, 58), (4, 32), (32, 136), (32, 110), (32, 84), (32, 58), (32, 32), (32, 4), (58, 136), (58, 110), (58, 84), (58, 58), (58, 32), (58, 4), (84, 136), (84, 110), (84, 84), (84, 58), (84, 32), (84, 4), (110, 136), (110, 110), (110, 84), (110, 58), (110, 32), (110, 4), (136, 136), (136, 110), (136, 84), (136, 58), (136, 32)],
+    [(4, 112), (4, 84), (4, 56), (4, 28), (28, 140), (28, 112), (28, 84), (28, 56), (28, 28), (28, 4), (56, 140), (56, 112), (56, 84), (56, 56), (56, 28), (56, 4), (84, 140), (84, 112), (84, 84), (84, 56), (84, 28), (84, 4), (112, 140), (112, 112), (112, 84), (112, 56), (112, 28), (112, 4), (140, 140), (140, 112), (140, 84), (140, 56), (140, 28)],
     [(4, 116), (4, 88), (4, 60), (4, 32), (32, 144), (32, 116), (32, 88), (32, 60), (32, 32), (32, 4), (60, 144), (60, 116), (60, 88), (60, 60), (60, 32), (60, 4), (88, 144), (88, 116), (88, 88), (88, 60), (88, 32), (88, 4), (116, 144), (116, 116), (116, 88), (116, 60), (116, 32), (116, 4), (144, 144), (144, 116), (144, 88), (144, 60), (144, 32)],
     [(4, 124), (4, 100), (4, 76), (4, 52), (4, 28), (28, 148), (28, 124), (28, 100), (28, 76), (28, 52), (28, 28), (28, 4), (52, 148), (52, 124), (52, 100), (52, 76), (52, 52), (52, 28), (52, 4), (76, 148), (76, 124), (76, 100), (76, 76), (76, 52), (76, 28), (76, 4), (100, 148), (100, 124), (100, 100), (100, 76), (100, 52), (100, 28), (100, 4), (124, 148), (124, 124), (124, 100), (124, 76), (124, 52), (124, 28), (124, 4), (148, 148), (148, 124), (148, 100), (148, 76), (148, 52), (148, 28)],  # v35
-    [(4, 134), (4, 98), (4, 82), (4, 56), (4, 30), (22, 152), (22, 134), (22, 98), (22, 82), (22, 56), (22, 30), (22, 4), (58, 152), (58, 134), (58, 98), (58, 82), (58, 56), (58, 30), (58, 4), (74, 152), (74, 134), (74, 98), (74, 82), (74, 56), (74, 30), (74, 4), (100, 152), (100, 134), (100, 98), (100, 82), (100, 56), (100, 30), (100, 4), (126, 152), (126, 134), (126, 98), (126, 82), (126, 56), (126, 30), (126, 4), (152, 152), (152, 134), (152, 98), (152, 82), (152, 56), (152, 30)],
-    [(4, 134), (4, 108), (4, 82), (4, 56), (4, 30), (26, 156), (26, 134), (26, 108), (26, 82), (26, 56), (26, 30), (26, 4), (52, 156), (52, 134), (52, 108), (52, 82), (52, 56), (52, 30), (52, 4), (78, 156), (78, 134), (78, 108), (78, 82), (78, 56), (78, 30), (78, 4), (104, 156), (104, 134), (104, 108), (104, 82), (104, 56), (104, 30), (104, 4), (130, 156), (130, 134), (130, 108), (130, 82), (130, 56), (130, 30), (130, 4), (156, 156), (156, 134), (156, 108), (156, 82), (156, 56), (156, 30)],
+    [(4, 126), (4, 100), (4, 74), (4, 48), (4, 22), (22, 152), (22, 126), (22, 100), (22, 74), (22, 48), (22, 22), (22, 4), (48, 152), (48, 126), (48, 100), (48, 74), (48, 48), (48, 22), (48, 4), (74, 152), (74, 126), (74, 100), (74, 74), (74, 48), (74, 22), (74, 4), (100, 152), (100, 126), (100, 100), (100, 74), (100, 48), (100, 22), (100, 4), (126, 152), (126, 126), (126, 100), (126, 74), (126, 48), (126, 22), (126, 4), (152, 152), (152, 126), (152, 100), (152, 74), (152, 48), (152, 22)],
+    [(4, 130), (4, 104), (4, 78), (4, 52), (4, 26), (26, 156), (26, 130), (26, 104), (26, 78), (26, 52), (26, 26), (26, 4), (52, 156), (52, 130), (52, 104), (52, 78), (52, 52), (52, 26), (52, 4), (78, 156), (78, 130), (78, 104), (78, 78), (78, 52), (78, 26), (78, 4), (104, 156), (104, 130), (104, 104), (104, 78), (104, 52), (104, 26), (104, 4), (130, 156), (130, 130), (130, 104), (130, 78), (130, 52), (130, 26), (130, 4), (156, 156), (156, 130), (156, 104), (156, 78), (156, 52), (156, 26)],
     [(4, 134), (4, 108), (4, 82), (4, 56), (4, 30), (30, 160), (30, 134), (30, 108), (30, 82), (30, 56), (30, 30), (30, 4), (56, 160), (56, 134), (56, 108), (56, 82), (56, 56), (56, 30), (56, 4), (82, 160), (82, 134), (82, 108), (82, 82), (82, 56), (82, 30), (82, 4), (108, 160), (108, 134), (108, 108), (108, 82), (108, 56), (108, 30), (108, 4), (134, 160), (134, 134), (134, 108), (134, 82), (134, 56), (134, 30), (134, 4), (160, 160), (160, 134), (160, 108), (160, 82), (160, 56), (160, 30)],
-    [(4, 144), (4, 116), (4, 88), (4, 60), (4, 32), (24, 164), (24, 144), (24, 116), (24, 88), (24, 60), (24, 32), (24, 4), (52, 164), (52, 144), (52, 116), (52, 88), (52, 60), (52, 32), (52, 4), (80, 164), (80, 144), (80, 116), (80, 88), (80, 60), (80, 32), (80, 4), (108, 164), (108, 144), (108, 116), (108, 88), (108, 60), (108, 32), (108, 4), (136, 164), (136, 144), (136, 116), (136, 88), (136, 60), (136, 32), (136, 4), (164, 164), (164, 144), (164, 116), (164, 88), (164, 60), (164, 32)],
-    [(4, 144), (4, 116), (4, 88), (4, 60), (4, 32), (28, 168), (28, 144), (28, 116), (28, 88), (28, 60), (28, 32), (28, 4), (56, 168), (56, 144), (56, 116), (56, 88), (56, 60), (56, 32), (56, 4), (84, 168), (84, 144), (84, 116), (84, 88), (84, 60), (84, 32), (84, 4), (112, 168), (112, 144), (112, 116), (112, 88), (112, 60), (112, 32), (112, 4), (140, 168), (140, 144), (140, 116), (140, 88), (140, 60), (140, 32), (140, 4), (168, 168), (168, 144), (168, 116), (168, 88), (168, 60), (168, 32)],  # v40
+    [(4, 136), (4, 108), (4, 80), (4, 52), (4, 24), (24, 164), (24, 136), (24, 108), (24, 80), (24, 52), (24, 24), (24, 4), (52, 164), (52, 136), (52, 108), (52, 80), (52, 52), (52, 24), (52, 4), (80, 164), (80, 136), (80, 108), (80, 80), (80, 52), (80, 24), (80, 4), (108, 164), (108, 136), (108, 108), (108, 80), (108, 52), (108, 24), (108, 4), (136, 164), (136, 136), (136, 108), (136, 80), (136, 52), (136, 24), (136, 4), (164, 164), (164, 136), (164, 108), (164, 80), (164, 52), (164, 24)],
+    [(4, 140), (4, 112), (4, 84), (4, 56), (4, 28), (28, 168), (28, 140), (28, 112), (28, 84), (28, 56), (28, 28), (28, 4), (56, 168), (56, 140), (56, 112), (56, 84), (56, 56), (56, 28), (56, 4), (84, 168), (84, 140), (84, 112), (84, 84), (84, 56), (84, 28), (84, 4), (112, 168), (112, 140), (112, 112), (112, 84), (112, 56), (112, 28), (112, 4), (140, 168), (140, 140), (140, 112), (140, 84), (140, 56), (140, 28), (140, 4), (168, 168), (168, 140), (168, 112), (168, 84), (168, 56), (168, 28)],  # v40
 ]
 
 EC_SHORT = {
@@ -215,6 +215,63 @@ EC_LONG = {
     '40L': 6, '40M': 31, '40Q': 34, '40H': 61
 }
 
+VERSION_INFORMATION = [""] * 7 + [
+    "000111110010010100",
+    "001000010110111100",
+    "001001101010011001",
+    "001010010011010011",  # v10
+    "001011101111110110",
+    "001100011101100010",
+    "001101100001000111",
+    "001110011000001101",
+    "001111100100101000",  # v15
+    "010000101101111000",
+    "010001010001011101",
+    "010010101000010111",
+    "010011010100110010",
+    "010100100110100110",  # v20
+    "010101011010000011",
+    "010110100011001001",
+    "010111011111101100",
+    "011000111011000100",
+    "011001000111100001",  # v25
+    "011010111110101011",
+    "011011000010001110",
+    "011100110000011010",
+    "011101001100111111",
+    "011110110101110101",  # v30
+    "011111001001010000",
+    "100000100111010101",
+    "100001011011110000",
+    "100010100010111010",
+    "100011011110011111",  # v35
+    "100100101100001011",
+    "100101010000101110",
+    "100110101001100100",
+    "100111010101000001",
+    "101000110001101001",  # v40
+]
+
+# Format information bits for each EC level, indexed by mask pattern (table C.1)
+FORMAT_INFORMATION = {
+    "L": [
+        "111011111000100", "111001011110011", "111110110101010", "111100010011101",
+        "110011000101111", "110001100011000", "110110001000001", "110100101110110"
+    ],
+    "M": [
+        "101010000010010", "101000100100101", "101111001111100", "101101101001011",
+        "100010111111001", "100000011001110", "100111110010111", "100101010100000"
+    ],
+    "Q": [
+        "011010101011111", "011000001101000", "011111100110001", "011101000000110",
+        "010010010110100", "010000110000011", "010111011011010", "010101111101101"
+    ],
+    "H": [
+        "001011010001001", "001001110111110", "001110011100111", "001100111010000",
+        "000011101100010", "000001001010101", "000110100001100", "000100000111011"
+    ]
+}
+
 
 class EC_LEVEL(Enum):
     L = "01"
@@ -226,13 +283,73 @@ class EC_LEVEL(Enum):
 class DATA_MODE(Enum):
     Numeric = 1
     Alphanumeric = 2
+    StructuredAppend = 3
     Byte = 4
+    ECI = 7
+    Kanji = 8
 
 
 CCI_LENGTH = {
     DATA_MODE.Numeric: [0] + [10] * 9 + [12] * 17 + [14] * 14,
     DATA_MODE.Alphanumeric: [0] + [9] * 9 + [11] * 17 + [13] * 14,
-    DATA_MODE.Byte: [0] + [8] * 9 + [16] * 17 + [16] * 14
+    DATA_MODE.Byte: [0] + [8] * 9 + [16] * 17 + [16] * 14,
+    DATA_MODE.Kanji: [0] + [8] * 9 + [10] * 17 + [12] * 14
 }
 
-REMAINDER_BITS = [0] + [0] + [7] * 5 + [0] * 7 + [3] * 7 + [4] * 7 + [3] * 7 + [0] * 6
+
+# Powers of 2 in GF(256) with the primitive polynomial x^8 + x^4 + x^3 + x^2 + 1 (285). Doubled so that
+# GF_EXP[log a + log b] never needs to be reduced mod 255
+GF_EXP = [
+    1, 2, 4, 8, 16, 32, 64, 128, 29, 58, 116, 232, 205, 135, 19, 38,
+    76, 152, 45, 90, 180, 117, 234, 201, 143, 3, 6, 12, 24, 48, 96, 192,
+    157, 39, 78, 156, 37, 74, 148, 53, 106, 212, 181, 119, 238, 193, 159, 35,
+    70, 140, 5, 10, 20, 40, 80, 160, 93, 186, 105, 210, 185, 111, 222, 161,
+    95, 190, 97, 194, 153, 47, 94, 188, 101, 202, 137, 15, 30, 60, 120, 240,
+    253, 231, 211, 187, 107, 214, 177, 127, 254, 225, 223, 163, 91, 182, 113, 226,
+    217, 175, 67, 134, 17, 34, 68, 136, 13, 26, 52, 104, 208, 189, 103, 206,
+    129, 31, 62, 124, 248, 237, 199, 147, 59, 118, 236, 197, 151, 51, 102, 204,
+    133, 23, 46, 92, 184, 109, 218, 169, 79, 158, 33, 66, 132, 21, 42, 84,
+    168, 77, 154, 41, 82, 164, 85, 170, 73, 146, 57, 114, 228, 213, 183, 115,
+    230, 209, 191, 99, 198, 145, 63, 126, 252, 229, 215, 179, 123, 246, 241, 255,
+    227, 219, 171, 75, 150, 49, 98, 196, 149, 55, 110, 220, 165, 87, 174, 65,
+    130, 25, 50, 100, 200, 141, 7, 14, 28, 56, 112, 224, 221, 167, 83, 166,
+    81, 162, 89, 178, 121, 242, 249, 239, 195, 155, 43, 86, 172, 69, 138, 9,
+    18, 36, 72, 144, 61, 122, 244, 245, 247, 243, 251, 235, 203, 139, 11, 22,
+    44, 88, 176, 125, 250, 233, 207, 131, 27, 54, 108, 216, 173, 71, 142, 1,
+    2, 4, 8, 16, 32, 64, 128, 29, 58, 116, 232, 205, 135, 19, 38, 76,
+    152, 45, 90, 180, 117, 234, 201, 143, 3, 6, 12, 24, 48, 96, 192, 157,
+    39, 78, 156, 37, 74, 148, 53, 106, 212, 181, 119, 238, 193, 159, 35, 70,
+    140, 5, 10, 20, 40, 80, 160, 93, 186, 105, 210, 185, 111, 222, 161, 95,
+    190, 97, 194, 153, 47, 94, 188, 101, 202, 137, 15, 30, 60, 120, 240, 253,
+    231, 211, 187, 107, 214, 177, 127, 254, 225, 223, 163, 91, 182, 113, 226, 217,
+    175, 67, 134, 17, 34, 68, 136, 13, 26, 52, 104, 208, 189, 103, 206, 129,
+    31, 62, 124, 248, 237, 199, 147, 59, 118, 236, 197, 151, 51, 102, 204, 133,
+    23, 46, 92, 184, 109, 218, 169, 79, 158, 33, 66, 132, 21, 42, 84, 168,
+    77, 154, 41, 82, 164, 85, 170, 73, 146, 57, 114, 228, 213, 183, 115, 230,
+    209, 191, 99, 198, 145, 63, 126, 252, 229, 215, 179, 123, 246, 241, 255, 227,
+    219, 171, 75, 150, 49, 98, 196, 149, 55, 110, 220, 165, 87, 174, 65, 130,
+    25, 50, 100, 200, 141, 7, 14, 28, 56, 112, 224, 221, 167, 83, 166, 81,
+    162, 89, 178, 121, 242, 249, 239, 195, 155, 43, 86, 172, 69, 138, 9, 18,
+    36, 72, 144, 61, 122, 244, 245, 247, 243, 251, 235, 203, 139, 11, 22, 44,
+    88, 176, 125, 250, 233, 207, 131, 27, 54, 108, 216, 173, 71, 142, 1, 0,
+]
+
+# Discrete logarithms in base 2, GF_LOG[GF_EXP[i]] == i. GF_LOG[0] is undefined and left to 0
+GF_LOG = [
+    0, 0, 1, 25, 2, 50, 26, 198, 3, 223, 51, 238, 27, 104, 199, 75,
+    4, 100, 224, 14, 52, 141, 239, 129, 28, 193, 105, 248, 200, 8, 76, 113,
+    5, 138, 101, 47, 225, 36, 15, 33, 53, 147, 142, 218, 240, 18, 130, 69,
+    29, 181, 194, 125, 106, 39, 249, 185, 201, 154, 9, 120, 77, 228, 114, 166,
+    6, 191, 139, 98, 102, 221, 48, 253, 226, 152, 37, 179, 16, 145, 34, 136,
+    54, 208, 148, 206, 143, 150, 219, 189, 241, 210, 19, 92, 131, 56, 70, 64,
+    30, 66, 182, 163, 195, 72, 126, 110, 107, 58, 40, 84, 250, 133, 186, 61,
+    202, 94, 155, 159, 10, 21, 121, 43, 78, 212, 229, 172, 115, 243, 167, 87,
+    7, 112, 192, 247, 140, 128, 99, 13, 103, 74, 222, 237, 49, 197, 254, 24,
+    227, 165, 153, 119, 38, 184, 180, 124, 17, 68, 146, 217, 35, 32, 137, 46,
+    55, 63, 209, 91, 149, 188, 207, 205, 144, 135, 151, 178, 220, 252, 190, 97,
+    242, 86, 211, 171, 20, 42, 93, 158, 132, 60, 57, 83, 71, 109, 65, 162,
+    31, 45, 67, 216, 183, 123, 164, 118, 196, 23, 73, 236, 127, 12, 111, 246,
+    108, 161, 59, 82, 41, 157, 85, 170, 251, 96, 134, 177, 187, 204, 62, 90,
+    203, 89, 95, 176, 156, 169, 160, 81, 11, 245, 22, 235, 122, 117, 44, 215,
+    79, 174, 213, 233, 230, 231, 173, 232, 116, 214, 244, 234, 168, 80, 88, 175,
+]
@@ -1,479 +1,506 @@
-from typing import List, Tuple, Union
+from __future__ import annotations
+
+import io
+from typing import TYPE_CHECKING, BinaryIO, Callable, Dict, List, Optional, TextIO, Tuple, Union
 
 import numpy
-from PIL import Image
 
-from constants import EC_LEVEL, ALIGNMENT_POSITIONS
+from constants import EC_LEVEL
+import cache
 import encoding
+from matrix import (CHEAP_RULES, MASK_PATTERNS, RULE_ORDER, MaskSearchStats, bitboard_score_rule, format_bits,
+                    format_positions, function_template, placement_order, search_masks)
+import pngstream
+import vector
+from penalty import penalty_scores, rule_scores, sampled_scores
+
+if TYPE_CHECKING:
+    from PIL import Image  # imported on first render, the matrix path doesn't need it
+
+
+_templates: List[Optional[Tuple[numpy.ndarray, numpy.ndarray]]] = [None] * 41
+
+
+def _function_template(version: int) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """
+    Returns the cached template of a version. Templates are built on first use and never modified.
+
+    :param version: The QR version
+    :return: A tuple (matrix, protected) of read-only arrays. matrix holds the function patterns with data modules set
+    to 0, protected is True for every function module (modules that must not be masked or written to)
+    """
+    if _templates[version] is None:
+        size = version * 4 + 17
+        modules, protected = function_template(version)
+        # Arrays over bytes objects are read-only
+        modules = numpy.frombuffer(modules, dtype=numpy.uint8).reshape(size, size)
+        protected = numpy.frombuffer(protected, dtype=bool).reshape(size, size)
+        _templates[version] = (modules, protected)
+    return _templates[version]
+
+
+_placement_indexes: List[Optional[Tuple[numpy.ndarray, numpy.ndarray]]] = [None] * 41
+
+
+def _placement_index(version: int) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """
+    Returns the coordinates of the data modules of a version in placement order (the zigzag defined in 7.7.3), bit k of
+    the codewords is written at (rows[k], cols[k]). Computed once per version.
+
+    :param version: The QR version
+    :return: A tuple (rows, cols) of read-only int arrays
+    """
+    if _placement_indexes[version] is not None:
+        return _placement_indexes[version]
+
+    size = version * 4 + 17
+    order = numpy.array(placement_order(version), dtype=numpy.intp)
+    rows, cols = order // size, order % size
+    rows.flags.writeable = False
+    cols.flags.writeable = False
+    _placement_indexes[version] = (rows, cols)
+    return rows, cols
+
+
+_mask_planes: List[Optional[numpy.ndarray]] = [None] * 41
+
+
+def _mask_plane_stack(version: int) -> numpy.ndarray:
+    """
+    Returns the 8 mask patterns of a version as a read-only (8, size, size) uint8 array. Function modules are always 0
+    so a mask is applied with a single xor.
+    """
+    if _mask_planes[version] is None:
+        size = version * 4 + 17
+        y, x = numpy.indices((size, size))
+        protected = _function_template(version)[1]
+        planes = numpy.array([pattern(x, y) & ~protected for pattern in MASK_PATTERNS], dtype=numpy.uint8)
+        planes.flags.writeable = False
+        _mask_planes[version] = planes
+    return _mask_planes[version]
+
+
+_format_indexes: List[Optional[Tuple[numpy.ndarray, numpy.ndarray]]] = [None] * 41
+
+
+def _format_index(version: int) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """
+    Returns the coordinates of the format information modules (Figure 19) as (rows, cols), in the order of the values
+    returned by _format_values: both copies of the 15 format bits followed by the dark module.
+    """
+    if _format_indexes[version] is None:
+        rows, cols = numpy.array(format_positions(version), dtype=numpy.intp).T
+        _format_indexes[version] = (rows, cols)
+    return _format_indexes[version]
+
+
+_format_value_tables: Dict[EC_LEVEL, numpy.ndarray] = {}
+
+
+def _format_values(ec_level: EC_LEVEL) -> numpy.ndarray:
+    """
+    Returns the module values written at _format_index for each mask as a (8, 31) uint8 array
+    """
+    if ec_level not in _format_value_tables:
+        _format_value_tables[ec_level] = numpy.array(format_bits(ec_level), dtype=numpy.uint8)
+    return _format_value_tables[ec_level]
+
+
+SCORE_BACKENDS = ("numpy", "bitboard")
+
+# How the mask is chosen. "exhaustive" finds the mask with the lowest penalty (ISO 18004), "fixed" uses the mask given
+# to QRImage, "sampled" scores every SAMPLE_STEP-th row and column only and "heuristic" scores the cheap N2 and N4 rules
+# only. The approximate policies are faster but can pick a mask with a higher penalty.
+MASK_POLICIES = ("exhaustive", "fixed", "sampled", "heuristic")
+SAMPLE_STEP = 4
+
+# Smallest version using the branch and bound mask search with the numpy backend. Below it, scoring every rule of the 8
+# candidates at once is faster than pruning
+PRUNED_SEARCH_VERSION = 10
+
+# PIL modes of the generated image: "L" is 8-bit grayscale, "1" is 1-bit black and white
+IMAGE_MODES = ("L", "1")
+
+
+def _check_mask_policy(policy: str, mask: int):
+    if policy not in MASK_POLICIES:
+        raise ValueError("Unknown mask policy, must be one of " + ", ".join(MASK_POLICIES))
+    if policy == "fixed" and mask == -1:
+        raise ValueError("The fixed mask policy needs a mask between 0 and 7")
+
+
+def _candidate_score_rule(candidates: numpy.ndarray) -> Callable[[List[int], int], numpy.ndarray]:
+    """
+    Returns the score_rule function of search_masks for a stack of 8 candidates
+    """
+    def score_rule(indexes: List[int], rule: int) -> numpy.ndarray:
+        # Slicing keeps a view of the candidates, indexing with a list would copy them
+        if len(indexes) == 8:
+            return rule_scores(candidates, rule)
+        return rule_scores(candidates[indexes[0]:indexes[0] + 1], rule)
+    return score_rule
+
+
+# Generation stages of a QRImage, in order. Invalidating a stage invalidates all the stages after it
+_CODEWORDS = 0  # version selection and codewords
+_PLACEMENT = 1  # codewords written to the unmasked matrix
+_MASK = 2  # mask selection and format information
+_RENDER = 3  # PIL image
+_UP_TO_DATE = 4
 
 
 class QRImage:
-    def __init__(self, version: int, ec_level: Union[EC_LEVEL, str], message: str, mask=-1):
+    __slots__ = ("_mask_policy", "_score_backend", "_message", "_mask", "_used_mask", "_boost_ecl", "_module_size",
+                 "_quiet_zone", "_image_mode", "_use_cache", "_compact", "_mask_search", "_image", "_requested_version",
+                 "_requested_ecl", "_stale", "_data", "_version", "_size", "_ecl", "_protected", "_unmasked", "_array",
+                 "_packed", "_structured_append")
+
+    def __init__(self, version: Optional[Union[int, str]], ec_level: Union[EC_LEVEL, str], message: encoding.Message,
+                 mask=-1, score_backend: str = "numpy", boost_ec_level: bool = False, module_size: int = 20,
+                 use_cache: bool = True, mask_policy: str = "exhaustive", compact: bool = False, quiet_zone: int = 0,
+                 image_mode: str = "L", structured_append: Optional[Tuple[int, int, int]] = None):
         """
         Create a QRImage object with the given arguments.
 
-        :param version: The QR version to use
-        :param ec_level: The error correction level to use
-        :param message: The message to write to the QR code
+        :param version: The QR version to use, None or "auto" to use the smallest version that can hold the message
+        :param ec_level: The error correction level to use (the minimum one when the version is automatic)
+        :param message: The message to write to the QR code, text or a binary payload (bytes, bytearray, memoryview)
+        :param score_backend: How masks are scored, one of SCORE_BACKENDS. "bitboard" uses python ints only
+        :param boost_ec_level: With an automatic version, use the highest EC level that fits in the selected version
+        :param module_size: The width of a module in pixels in the generated image
+        :param use_cache: Look up and store the symbol and its renders in the process-wide cache (see cache.py)
+        :param mask_policy: How the mask is chosen when it isn't forced, one of MASK_POLICIES
+        :param compact: Only keep the bit-packed matrix (size * ceil(size / 8) bytes instead of 2 * size * size) once
+        the symbol is built, for instances kept alive in large numbers. Changing the mask then redoes the placement too
+        :param quiet_zone: The width of the light border around the code in the generated image, in modules. The
+        standard asks for 4
+        :param image_mode: The PIL mode of the generated image, one of IMAGE_MODES
+        :param structured_append: For a symbol of a Structured Append message, a tuple (index of the symbol, number of
+        symbols, parity of the whole message). See structured.py to split a message
+        :raise encoding.EncodingError: if the message can't be encoded
+        :raise ValueError: if the message is too long for the version and error correction level
         """
-        self._size = version * 4 + 17
-        self._version = version
-        self._message = message
+        if score_backend not in SCORE_BACKENDS:
+            raise ValueError("Unknown score backend, must be one of " + ", ".join(SCORE_BACKENDS))
+        _check_mask_policy(mask_policy, mask)
+        self._mask_policy = mask_policy
+        self._score_backend = score_backend
+        self._message = encoding.as_payload(message)
+        self._structured_append = None if structured_append is None else tuple(structured_append)
         self._mask = mask  # -1 if we want to find optimal mask, otherwise force mask value
         self._used_mask = 0
+        self._boost_ecl = boost_ec_level
+        self._module_size = module_size
+        self._quiet_zone = quiet_zone
+        if image_mode not in IMAGE_MODES:
+            raise ValueError("Unknown image mode, must be one of " + ", ".join(IMAGE_MODES))
+        self._image_mode = image_mode
+        self._use_cache = use_cache
+        self._compact = compact
+        self._unmasked = self._array = self._packed = None
+        self._mask_search = MaskSearchStats(mask_policy)
+        self._image = None
+
+        # Requested settings, the version and EC level used can differ when the version is automatic
+        self._requested_version = None if version in (None, "auto") else version
+        self._requested_ecl = EC_LEVEL[ec_level] if type(ec_level) is str else ec_level  # Cast to enum if needed
+
+        # Create the qr code now so that errors are raised by the constructor, the image is only created when requested
+        self._stale = _CODEWORDS  # first stage that needs to be recomputed
+        self._update(_MASK)
+
+    def _invalidate(self, stage: int):
+        """
+        Marks a stage, and all the stages after it, as needing to be recomputed
+        """
+        if stage == _MASK and self._unmasked is None:
+            stage = _PLACEMENT  # compacted, the unmasked matrix has to be rebuilt
+        self._stale = min(self._stale, stage)
 
-        # Cast ec_level to EC_LEVEL enum if needed
-        if type(ec_level) is str:
-            self._ecl = EC_LEVEL[ec_level]
-        else:
-            self._ecl = ec_level
-
-        # Create 2 arrays with correct size based on the version
-        self._array = [[-1 for _ in range(self._size)] for _ in range(self._size)]
-        self._unmasked = [[-1 for _ in range(self._size)] for _ in range(self._size)]
+    def _update(self, stage: int):
+        """
+        Recomputes the stale stages up to (including) the given one
+        """
+        store = False
+        if self._use_cache and self._stale <= _MASK <= stage:
+            # The masked symbol is needed, it may have been built by another instance
+            entry = cache.matrices.get(self._symbol_key())
+            if entry is None:
+                store = True
+            else:
+                self._version, self._ecl, self._data, self._unmasked, self._protected, self._used_mask, self._array \
+                    = entry
+                self._size = self._version * 4 + 17
+                self._mask_search = MaskSearchStats("fixed" if self._mask != -1 else self._mask_policy)
+                self._stale = _RENDER
+
+        while self._stale <= stage:
+            if self._stale == _CODEWORDS:
+                self._encode()
+            elif self._stale == _PLACEMENT:
+                self._write_data()
+            elif self._stale == _MASK:
+                self._write_best_mask()
+            elif self._stale == _RENDER:
+                self._image = self._generate_image()
+            self._stale += 1
+
+        if store:
+            self._store_symbol()
+        if self._compact and self._array is not None and self._stale > _MASK:
+            self._packed = numpy.packbits(self._array, axis=1)
+            self._unmasked = self._array = None
+
+    def _symbol_key(self) -> tuple:
+        """
+        Returns the settings the masked symbol depends on
+        """
+        policy = "fixed" if self._mask != -1 else self._mask_policy
+        return (self._message, self._requested_version, self._requested_ecl, self._boost_ecl, self._mask, policy,
+                self._structured_append)
 
-        # Compute the codewords for the message
-        self._data = encoding.generate_codewords(self._message, self._version, self._ecl)
+    def _store_symbol(self):
+        """
+        Adds the masked symbol to the cache. Cached arrays are shared between instances so they are made read-only,
+        every stage writing to them starts from a new array.
+        """
+        self._array.flags.writeable = False
+        self._unmasked.flags.writeable = False
+        entry = (self._version, self._ecl, self._data, self._unmasked, self._protected, self._used_mask, self._array)
+        cache.matrices.put(self._symbol_key(), entry, self._array.nbytes + self._unmasked.nbytes + len(self._data))
 
-        # Create the qr code
-        self._draw_initial()  # drawing the static modules (finder patterns, etc)
-        self._write_data()  # draw the data and apply masking
+    def _encode(self):
+        """
+        Selects the version and EC level to use and computes the codewords
+        """
+        if self._requested_version is None:
+            version, ecl = encoding.select_version(self._message, self._requested_ecl, self._boost_ecl,
+                                                   self._structured_append)
+        else:
+            version, ecl = self._requested_version, self._requested_ecl
 
-        # Create the PIL image
-        self._image = self._generate_image()
-        self._need_regen: bool = False
+        self._data = encoding.generate_codewords(self._message, version, ecl, self._structured_append)
+        self._version = version
+        self._size = version * 4 + 17
+        self._ecl = ecl
 
     def _draw_initial(self):
         """
-        Writes the static patterns to the unmasked array
+        Copies the function patterns of the version to the unmasked array
         """
-
-        def draw_timing_patterns():
-            # As defined in 7.3.4
-            # Vertical pattern
-            for y in range(self._size):
-                self._unmasked[y][6] = (y + 1) % 2
-
-            # Horizontal pattern
-            for x in range(self._size):
-                self._unmasked[6][x] = (x + 1) % 2
-
-        def draw_finder_patterns():
-            # As defined in 7.3.2
-            x_offset = [0, self._size - 7, 0]
-            y_offset = [0, 0, self._size - 7]
-
-            for pattern in range(3):
-                for x in range(7):
-                    for y in range(7):
-                        color = 0
-
-                        if x in [0, 6] or y in [0, 6]:  # in outer pattern
-                            color = 1
-                        elif x not in [1, 5] and y not in [1, 5]:  # not in middle pattern (in inner pattern)
-                            color = 1
-
-                        self._unmasked[y + y_offset[pattern]][x + x_offset[pattern]] = color
-
-        def draw_spacing_and_format():
-            # top left
-            for x in range(9):
-                self._unmasked[7][x] = 0
-                self._unmasked[8][x] = x == 6  # doesn't overwrite existing timing pattern
-            for y in range(9):
-                self._unmasked[y][7] = 0
-                self._unmasked[y][8] = y == 6
-
-            # top right
-            for x in range(self._size - 8, self._size):
-                self._unmasked[7][x] = 0
-                self._unmasked[8][x] = 0
-            for y in range(9):
-                self._unmasked[y][self._size - 8] = 0
-
-            # bottom left
-            for y in range(self._size - 8, self._size):
-                self._unmasked[y][7] = 0
-                self._unmasked[y][8] = 0
-            for x in range(9):
-                self._unmasked[self._size - 8][x] = x == 8  # write the format black module
-
-        def draw_alignment_patterns():
-            pos = ALIGNMENT_POSITIONS[self._version]
-
-            for pair in pos:
-                x_offset, y_offset = pair
-                for x in range(5):
-                    for y in range(5):
-                        if x in [0, 4] or y in [0, 4] or x == y == 2:
-                            # outer square or inner dot
-                            self._unmasked[y + y_offset][x + x_offset] = 1
-                        else:
-                            self._unmasked[y + y_offset][x + x_offset] = 0
-
-        def draw_version_information():
-            table = [""] * 7 + [
-                "000111110010010100",
-                "001000010110111100",
-                "001001101010011001",
-                "001010010011010011",  # v10
-                "001011101111110110",
-                "001100011101100010",
-                "001101100001000111",
-                "001110011000001101",
-                "001111100100101000",  # v15
-                "010000101101111000",
-                "010001010001011101",
-                "010010101000010111",
-                "010011010100110010",
-                "010100100110100110",  # v20
-                "010101011010000011",
-                "010110100011001001",
-                "010111011111101100",
-                "011000111011000100",
-                "011001000111100001",  # v25
-                "011010111110101011",
-                "011011000010001110",
-                "011100110000011010",
-                "011101001100111111",
-                "011110110101110101",  # v30
-                "011111001001010000",
-                "100000100111010101",
-                "100001011011110000",
-                "100010100010111010",
-                "100011011110011111",  # v35
-                "100100101100001011",
-                "100101010000101110",
-                "100110101001100100",
-                "100111010101000001",
-                "101000110001101001",  # v40
-            ]
-
-            version_info = table[self._version]
-
-            # top right
-            x = y = 0
-            for i in range(len(version_info)):
-                self._unmasked[y + 5][self._size + x - 9] = int(version_info[i])
-
-                if x == -2:
-                    x = 0
-                    y -= 1
-                else:
-                    x -= 1
-
-            # bottom left
-            x = y = 0
-            for i in range(len(version_info)):
-                self._unmasked[self._size + y - 9][x + 5] = int(version_info[i])
-
-                if y == - 2:
-                    y = 0
-                    x -= 1
-                else:
-                    y -= 1
-
-        draw_timing_patterns()
-        draw_finder_patterns()
-        draw_spacing_and_format()
-        if self._version > 1:
-            draw_alignment_patterns()  # not needed for version 1
-        if self._version >= 7:
-            draw_version_information()
+        template, self._protected = _function_template(self._version)
+        self._unmasked = template.copy()
 
     def get_version(self) -> int:
+        self._update(_CODEWORDS)  # the version depends on the message when it is automatic
         return self._version
 
-    def set_version(self, new_version: int):
+    def set_version(self, new_version: Optional[Union[int, str]]):
         """
-        Set a new version for the instance
+        Set a new version for the instance. The QR code is regenerated when it is next requested, which raises
+        ValueError if the current message is too long for the instance's error correction level and new version.
 
-        :param new_version: The new version to use
-        :raise ValueError: if the current message is too long for the instance's error correction level and new version
+        :param new_version: The new version to use, None or "auto" to use the smallest version that can hold the message
         """
-        self._version = new_version
-        self._size = self._version * 4 + 17
-
-        # Recreate array and unmasked since new version means new size
-        self._array = [[-1 for _ in range(self._size)] for _ in range(self._size)]
-        self._unmasked = [[-1 for _ in range(self._size)] for _ in range(self._size)]
-
-        # regen encoded data with new version
-        self._data = encoding.generate_codewords(self._message, self._version, self._ecl)
-        self._need_regen = True  # Set need_regen to True to only generate image when requested for the first time.
-        self._write_data()
+        self._requested_version = None if new_version in (None, "auto") else new_version
+        self._invalidate(_CODEWORDS)
 
     def get_error_correction_level(self) -> EC_LEVEL:
+        self._update(_CODEWORDS)  # can be boosted when the version is automatic
         return self._ecl
 
     def set_error_correction_level(self, new_ecl: Union[EC_LEVEL, str]):
         """
-        Set a new error correction level for the instance
+        Set a new error correction level for the instance. The QR code is regenerated when it is next requested, which
+        raises ValueError if the current message is too long for the instance's version and new error correction level.
 
-        :param new_ecl: The new error correction level to use
-        :raise ValueError: if the current message is too long for the instance's version and new error correction level
+        :param new_ecl: The new error correction level to use (the minimum one when the version is automatic)
         """
         if type(new_ecl) is str:
-            self._ecl = EC_LEVEL[new_ecl]  # Cast to enum
+            self._requested_ecl = EC_LEVEL[new_ecl]  # Cast to enum
         else:
-            self._ecl = new_ecl
+            self._requested_ecl = new_ecl
+        self._invalidate(_CODEWORDS)
 
-        self._data = encoding.generate_codewords(self._message, self._version, self._ecl)
-        self._need_regen = True
-        self._write_data()
-
-    def get_message(self) -> str:
+    def get_message(self) -> Union[str, bytes]:
         return self._message
 
-    def set_message(self, new_msg: str):
+    def set_message(self, new_msg: encoding.Message):
         """
-        Set a new message for the instance
+        Set a new message for the instance. The QR code is regenerated when it is next requested, which raises
+        ValueError if the new message is too long for the instance's version and error correction level.
 
-        :param new_msg: The new message to use
-        :raise ValueError: if the new message is too long for the instance's version and error correction level
+        :param new_msg: The new message to use, text or a binary payload
+        :raise encoding.EncodingError: if the message is neither text nor a bytes-like object
         """
-        self._message = new_msg
-        self._data = encoding.generate_codewords(self._message, self._version, self._ecl)
-        self._need_regen = True
-        self._write_data()
+        self._message = encoding.as_payload(new_msg)
+        self._invalidate(_CODEWORDS)
 
     def get_mask(self) -> int:
         if self._mask == -1:
             # not using forced mask
+            self._update(_MASK)
             return self._used_mask
         else:
             return self._mask
 
     def set_mask(self, new_mask: int):
-        if not 0 <= new_mask <= 7:
-            raise ValueError("Illegal mask pattern, must be between 0 and 7")
+        """
+        Force a mask pattern, -1 to select the best one again. Only the masking stage is redone.
+        """
+        if not -1 <= new_mask <= 7:
+            raise ValueError("Illegal mask pattern, must be between 0 and 7 (or -1 for automatic)")
+        _check_mask_policy(self._mask_policy, new_mask)
 
         self._mask = new_mask
-        self._write_best_mask()
-        self._need_regen = True
+        self._invalidate(_MASK)
 
-    def _write_data(self):
+    def get_mask_policy(self) -> str:
+        return self._mask_policy
+
+    def set_mask_policy(self, new_policy: str):
         """
-        Write the contents of _data to the _unmasked matrix
+        Set how the mask is chosen, one of MASK_POLICIES. Only the masking stage is redone.
         """
+        _check_mask_policy(new_policy, self._mask)
+        self._mask_policy = new_policy
+        self._invalidate(_MASK)
 
-        def next_move(x: int, y: int) -> Tuple[int, int]:
-            """
-            Calculates the new position based on the current one.
+    def get_mask_search_stats(self) -> MaskSearchStats:
+        """
+        Returns the chosen mask, its full penalty and the work done by the last mask search of this instance. Nothing is
+        searched when the mask is forced or the symbol comes from the cache
+        """
+        self._update(_MASK)
+        stats = self._mask_search
+        if stats.mask is None:
+            stats.mask = self.get_mask()
+        if stats.score is None:
+            # The approximate policies never score the chosen mask fully, only pay for it when asked
+            stats.score = int(penalty_scores(self._modules()[numpy.newaxis]).sum())
+        return stats
+
+    def get_module_size(self) -> int:
+        return self._module_size
+
+    def set_module_size(self, new_size: int):
+        """
+        Set the width of a module in pixels in the generated image. Only the image is regenerated.
+        """
+        if new_size < 1:
+            raise ValueError("Module size must be at least 1 pixel")
 
-            :param x: The current x position
-            :param y: The current y position
-            :return: A tuple containing the new x and y coordinates
-            """
-            if x is None and y is None:
-                # initial
-                return self._size - 1, self._size - 1
-
-            # edge-case: transition between normal zone and left zone
-            if y == 0 and x == 7:
-                return 5, 0
-
-            if x >= 7:
-                # normal zone
-                up = ((x + 1) // 2) % 2 == 0  # boolean checking if we're moving up
-
-                if up:
-                    if x % 2 == 0:
-                        # going left
-                        return x - 1, y
-                    else:
-                        # going up right
-                        if y == 0:
-                            # already at top, switch lane
-                            return x - 1, y
-                        else:
-                            return x + 1, y - 1
-                else:
-                    # down
-                    if x % 2 == 0:
-                        # going left
-                        return x - 1, y
-                    else:
-                        # going down right
-                        if y == self._size - 1:
-                            # bottom, switch lane
-                            return x - 1, y
-                        else:
-                            return x + 1, y + 1
+        self._module_size = new_size
+        self._invalidate(_RENDER)
 
-            else:
-                # left-most zone
-                up = x in [2, 3]
+    def get_quiet_zone(self) -> int:
+        return self._quiet_zone
 
-                if up:
-                    if x % 2 == 1:
-                        # going left
-                        return x - 1, y
-                    else:
-                        # up-right
-                        if y == 0:
-                            # top
-                            return x - 1, y
-                        else:
-                            return x + 1, y - 1
-                else:
-                    # down
-                    if x % 2 == 1:
-                        return x - 1, y
-                    else:
-                        if y == self._size - 1:
-                            return x - 1, y
-                        else:
-                            return x + 1, y + 1
+    def set_quiet_zone(self, new_width: int):
+        """
+        Set the width of the light border around the code in the generated image, in modules. Only the image is
+        regenerated.
+        """
+        if new_width < 0:
+            raise ValueError("Quiet zone can't be negative")
 
-        x = y = None
+        self._quiet_zone = new_width
+        self._invalidate(_RENDER)
 
-        for i in range(len(self._data)):
-            x, y = next_move(x, y)
+    def get_image_mode(self) -> str:
+        return self._image_mode
 
-            while self._unmasked[y][x] != -1:  # if not -1, has been written to (static pattern)
-                x, y = next_move(x, y)  # go to next position until we're not in a static pattern anymore
+    def set_image_mode(self, new_mode: str):
+        """
+        Set the PIL mode of the generated image, one of IMAGE_MODES. Only the image is regenerated.
+        """
+        if new_mode not in IMAGE_MODES:
+            raise ValueError("Unknown image mode, must be one of " + ", ".join(IMAGE_MODES))
 
-            self._unmasked[y][x] = int(self._data[i])  # write bit to current position
+        self._image_mode = new_mode
+        self._invalidate(_RENDER)
 
-        self._write_best_mask()  # Find the optimal mask for the unmasked matrix
+    def _write_data(self):
+        """
+        Write the contents of _data to the _unmasked matrix
+        """
+        self._draw_initial()  # drawing the static modules (finder patterns, etc)
+        rows, cols = _placement_index(self._version)
+
+        # Codewords are written MSB-first, the modules left after them are the remainder bits (always 0)
+        bits = numpy.zeros(len(rows), dtype=numpy.uint8)
+        bits[:len(self._data) * 8] = numpy.unpackbits(numpy.frombuffer(self._data, dtype=numpy.uint8))
+        self._unmasked[rows, cols] = bits
+
+    def _apply_mask(self, mask: int):
+        """
+        Writes the unmasked matrix masked with the given pattern, and its format information, to _array
+        """
+        format_rows, format_cols = _format_index(self._version)
+        self._array = self._unmasked ^ _mask_plane_stack(self._version)[mask]
+        self._array[format_rows, format_cols] = _format_values(self._ecl)[mask]
 
     def _write_best_mask(self):
         """
         Reads the _unmasked matrix to determine the best mask and writes the masked matrix to _array unless the
         instance has a specific mask value set.
         """
-
-        def is_protected(x: int, y: int) -> bool:
-            """
-            Checks if we can make changes to the coordinates
-            :param x: The x coordinate
-            :param y: The y coordinate
-            :return: True if it is protected, false if it is not and we can make changes
-            """
-            if x == 6 or y == 6:
-                # Timing pattern
-                return True
-            if x <= 8 and y <= 8 or x >= (self._size - 8) and y <= 8 or x <= 8 and y >= (self._size - 8):
-                # Finder pattern
-                return True
-
-            if self._version > 1:
-                # Alignment pattern
-                positions = ALIGNMENT_POSITIONS[self._version]
-                for position in positions:
-                    x_pos, y_pos = position
-                    if x_pos <= x <= x_pos + 4 and y_pos <= y <= y_pos + 4:
-                        return True
-            if self._version >= 7:
-                # version info section
-                if x <= 5 and y >= self._size - 11 or x >= self._size - 11 and y <= 5:
-                    return True
-
-        def mask_pattern(pattern: int) -> List[List[int]]:
-            masked_array = [row[:] for row in self._unmasked]  # deep copy
-            self._write_format_information(masked_array, pattern)
-
-            if pattern == 0:
-                def pattern_formula(x, y): return (y + x) % 2 == 0
-            elif pattern == 1:
-                def pattern_formula(x, y): return y % 2 == 0
-            elif pattern == 2:
-                def pattern_formula(x, y): return x % 3 == 0
-            elif pattern == 3:
-                def pattern_formula(x, y): return (y + x) % 3 == 0
-            elif pattern == 4:
-                def pattern_formula(x, y): return ((y // 2) + (x // 3)) % 2 == 0
-            elif pattern == 5:
-                def pattern_formula(x, y): return (y * x) % 2 + (y * x) % 3 == 0
-            elif pattern == 6:
-                def pattern_formula(x, y): return ((y * x) % 2 + (y * x) % 3) % 2 == 0
-            elif pattern == 7:
-                def pattern_formula(x, y): return ((y + x) % 2 + (y * x) % 3) % 2 == 0
-            else:
-                raise ValueError("Illegal mask pattern")  # technically should not be called
-
-            # Xor the unmasked array with the pattern formula to get a masked matrix
-            for x in range(self._size):
-                for y in range(self._size):
-                    if not is_protected(x, y):  # check coordinates aren't static pattern, if not, proceed
-                        masked_array[y][x] ^= pattern_formula(x, y)
-            return masked_array
-
         if self._mask != -1:
             # Forced mask, use specified one
-            self._array = mask_pattern(self._mask)
+            self._mask_search = MaskSearchStats("fixed")
+            self._apply_mask(self._mask)
             return
 
         # No forced mask, find best one
-        # initialize values by computing mask 0, loop for mask 1-7
-        self._array = mask_pattern(0)
-        lowest_score = self._calculate_mask_score(self._array)
-        self._used_mask = 0
-
-        for mask in range(1, 8):
-            masked = mask_pattern(mask)
-            score = self._calculate_mask_score(masked)
-            if score < lowest_score:
-                lowest_score = score
-                self._array = masked
-                self._used_mask = mask
-
-    def _write_format_information(self, array: List[List[int]], mask_pattern: int):
-        # Using hardcoded table since there is only a few options and computing the bits would be time consuming.
-        table = dict({
-            "L": [
-                "111011111000100", "111001011110011", "111110110101010", "111100010011101",
-                "110011000101111", "110001100011000", "110110001000001", "110100101110110"
-            ],
-            "M": [
-                "101010000010010", "101000100100101", "101111001111100", "101101101001011",
-                "100010111111001", "100000011001110", "100111110010111", "100101010100000"
-            ],
-            "Q": [
-                "011010101011111", "011000001101000", "011111100110001", "011101000000110",
-                "010010010110100", "010000110000011", "010111011011010", "010101111101101"
-            ],
-            "H": [
-                "001011010001001", "001001110111110", "001110011100111", "001100111010000",
-                "000011101100010", "000001001010101", "000110100001100", "000100000111011"
-            ]
-        })
-
-        info = table[self._ecl.name][mask_pattern]
-
-        # Write the format information as described in Figure 19
-
-        i = 0
-        # left horizontal
-        for x in range(9):
-            if x != 6:
-                array[8][x] = int(info[i])
-                i += 1
-
-        # top vertical
-        for y in range(7, -1, -1):
-            if y != 6:
-                array[y][8] = int(info[i])
-                i += 1
+        stats = self._mask_search = MaskSearchStats(self._mask_policy)
+        if self._mask_policy == "sampled":
+            candidates = self._mask_candidates()
+            scores = sampled_scores(candidates, SAMPLE_STEP).sum(axis=1)
+            stats.evaluated_rules = 32
+            self._used_mask = int(scores.argmin())  # lowest mask number wins ties
+            self._array = candidates[self._used_mask].copy()  # don't keep the other candidates alive
+            return
 
-        i = 0
-        # bottom vertical
-        for y in range(self._size - 1, self._size - 8, -1):
-            array[y][8] = int(info[i])
-            i += 1
+        if self._score_backend == "bitboard":
+            # Only the best candidate is built as a matrix
+            score_rule = bitboard_score_rule(self._unmasked.tobytes(), self._version, self._ecl)
+            candidates = None
+        else:
+            candidates = self._mask_candidates()
+            if self._mask_policy == "exhaustive" and self._version < PRUNED_SEARCH_VERSION:
+                scores = penalty_scores(candidates).sum(axis=1)
+                stats.evaluated_rules = 32
+                self._used_mask = int(scores.argmin())  # lowest mask number wins ties
+                stats.score = int(scores[self._used_mask])
+                self._array = candidates[self._used_mask].copy()  # don't keep the other candidates alive
+                return
+            score_rule = _candidate_score_rule(candidates)
+
+        if self._mask_policy == "heuristic":
+            masks = list(range(8))
+            scores = [sum(values) for values in zip(*(score_rule(masks, rule) for rule in RULE_ORDER[:CHEAP_RULES]))]
+            stats.evaluated_rules = 8 * CHEAP_RULES
+            self._used_mask = scores.index(min(scores))  # lowest mask number wins ties
+        else:
+            self._used_mask, stats.score = search_masks(score_rule, stats)
 
-        # right horizontal
-        for x in range(self._size - 8, self._size):
-            array[8][x] = int(info[i])
-            i += 1
+        if candidates is None:
+            self._apply_mask(self._used_mask)
+        else:
+            self._array = candidates[self._used_mask].copy()  # don't keep the other candidates alive
 
-        # dark module
-        array[self._size - 8][8] = 1
+    def _mask_candidates(self) -> numpy.ndarray:
+        """
+        Xors the unmasked array with every pattern at once to get the 8 masked candidates, with their format information
+        """
+        candidates = self._unmasked ^ _mask_plane_stack(self._version)
+        format_rows, format_cols = _format_index(self._version)
+        candidates[:, format_rows, format_cols] = _format_values(self._ecl)
+        return candidates
 
     def _calculate_mask_score(self, array: List[List[int]]) -> int:
         """
-        Calculates the mask score of the array
+        Calculates the mask score of the array. Reference implementation of penalty.penalty_scores
 
         :param array: The array to use in the calculation
         :return: The overall mask score of the array
@@ -549,7 +576,7 @@ class QRImage:
             pad_after = [1, 0, 1, 1, 1, 0, 1, 0, 0, 0, 0]
 
             for row in array:
-                for i in range(self._size - 11):
+                for i in range(self._size - 10):
                     sub_row = row[i:i + 11]
                     if sub_row in [pad_before, pad_after]:
                         # pattern match
@@ -557,7 +584,7 @@ class QRImage:
 
             for i in range(self._size):
                 col = [row[i] for row in array]
-                for j in range(self._size - 11):
+                for j in range(self._size - 10):
                     sub_col = col[j:j + 11]
                     if sub_col in [pad_before, pad_after]:
                         score += 40
@@ -584,24 +611,179 @@ class QRImage:
 
         return colored_rows() + colored_cols() + colored_boxes() + finder_pattern() + color_proportion()
 
-    def _generate_image(self) -> Image:
+    def _generate_image(self) -> Image.Image:
         """
-        Creates a PIL image object from the _array variable
+        Creates a PIL image object from the modules. "L" images are written as uint8 directly at their final size, "1"
+        images are drawn with 1 pixel per module and upscaled by PIL so they never take more than 1 bit per pixel
         """
-        np_array = [[255 if i != 1 else 0 for i in row] for row in self._array]
+        from PIL import Image
+
+        width = (self._size + 2 * self._quiet_zone) * self._module_size
+        if self._image_mode == "1":
+            modules = numpy.empty((self._size + 2 * self._quiet_zone,) * 2, dtype=bool)
+            self.render_into(modules, module_size=1, dark=False, light=True)
+            return Image.fromarray(modules).resize((width, width), Image.NEAREST)
 
-        # Upscaling
-        # TODO remove / implement better
-        np_array = numpy.kron(np_array, numpy.ones((20, 20)))
+        pixels = numpy.empty((width, width), dtype=numpy.uint8)
+        self.render_into(pixels)
+        return Image.fromarray(pixels)
+
+    def get_matrix(self) -> numpy.ndarray:
+        """
+        Returns the modules of the QR code (1 for dark modules), without quiet zone. The array is a view of the
+        instance's own buffer (no copy) unless the instance is compact. It supports the buffer protocol, use
+        memoryview() on it to get a plain buffer.
 
-        return Image.fromarray(np_array.astype(numpy.uint8), mode='L')
+        :return: A read-only (size, size) uint8 array
+        """
+        self._update(_MASK)
+        matrix = self._modules().view()
+        matrix.flags.writeable = False
+        return matrix
+
+    def to_bytes(self) -> bytes:
+        """
+        Returns the modules packed 8 per byte, 1 for dark modules. Every row starts on a new byte, with the first module
+        in the most significant bit, and the last byte of a row is padded with 0 bits.
+
+        :return: size * ceil(size / 8) bytes
+        """
+        self._update(_MASK)
+        if self._array is None:
+            return self._packed.tobytes()
+        return numpy.packbits(self._array, axis=1).tobytes()
+
+    def render_into(self, buffer: numpy.ndarray, offset: Tuple[int, int] = (0, 0), module_size: Optional[int] = None,
+                    quiet_zone: Optional[int] = None, dark: int = 0, light: int = 255):
+        """
+        Draws the QR code into an existing 2-D array, without allocating an image. Can be used to lay out many codes on
+        one page.
+
+        :param buffer: The writable 2-D array to draw into, of any integer dtype
+        :param offset: The (row, column) pixel of the buffer where the top left corner of the code (quiet zone included)
+        is drawn
+        :param module_size: The width of a module in pixels, the instance's module size by default
+        :param quiet_zone: The width of the light border around the code in modules, the instance's one by default
+        :param dark: The value of dark pixels
+        :param light: The value of light pixels
+        :raise ValueError: if the code doesn't fit in the buffer at this offset
+        """
+        module_size = self._module_size if module_size is None else module_size
+        quiet_zone = self._quiet_zone if quiet_zone is None else quiet_zone
+        matrix = self.get_matrix()
+        size = self._size
+        width = (size + 2 * quiet_zone) * module_size
+        top, left = offset
+        if buffer.ndim != 2 or top < 0 or left < 0 or top + width > buffer.shape[0] or left + width > buffer.shape[1]:
+            raise ValueError("The code ({0:d}x{0:d} pixels) doesn't fit in the buffer at this offset".format(width))
+
+        area = buffer[top:top + width, left:left + width]
+        area[...] = light  # quiet zone
+        code = area[quiet_zone * module_size:width - quiet_zone * module_size,
+                    quiet_zone * module_size:width - quiet_zone * module_size]
+
+        # View the code area as (row, pixel row, column, pixel column) so every module is a single broadcast write
+        row_stride, column_stride = code.strides
+        blocks = numpy.lib.stride_tricks.as_strided(
+            code, shape=(size, module_size, size, module_size),
+            strides=(row_stride * module_size, row_stride, column_stride * module_size, column_stride))
+        colors = numpy.array([light, dark], dtype=buffer.dtype)
+        blocks[...] = colors[matrix][:, numpy.newaxis, :, numpy.newaxis]
+
+    def _modules(self) -> numpy.ndarray:
+        """
+        Returns the masked matrix, unpacked if the instance is compact
+        """
+        if self._array is not None:
+            return self._array
+        return numpy.unpackbits(self._packed, axis=1, count=self._size)
 
-    def get_image(self) -> Image:
+    def get_image(self) -> Image.Image:
         """
         Returns the representation of the QR code as an image
 
         :return: A PIL Image object
         """
-        if self._need_regen:
-            self._image = self._generate_image()
+        self._update(_RENDER)
         return self._image
+
+    def write_png(self, output: Union[str, BinaryIO], module_size: Optional[int] = None,
+                  quiet_zone: Optional[int] = None, bit_depth: Optional[int] = None) -> int:
+        """
+        Streams the QR code as a PNG image to a file, without PIL and without holding the whole image in memory. Meant
+        for very large renders (print resolutions), see pngstream.py
+
+        :param output: A path, or a binary file-like object (file, pipe, socket.makefile("wb"), ...)
+        :param module_size: The width of a module in pixels, the instance's module size by default
+        :param quiet_zone: The width of the light border around the code in modules, the instance's one by default
+        :param bit_depth: 1 or 8, by default 1 for "1" images and 8 for "L" images
+        :return: The number of bytes written
+        """
+        module_size = self._module_size if module_size is None else module_size
+        quiet_zone = self._quiet_zone if quiet_zone is None else quiet_zone
+        if bit_depth is None:
+            bit_depth = 1 if self._image_mode == "1" else 8
+        matrix = self.get_matrix()
+
+        if isinstance(output, str):
+            with open(output, "wb") as file:
+                return pngstream.write_png(file, matrix, self._size, module_size, quiet_zone, bit_depth)
+        return pngstream.write_png(output, matrix, self._size, module_size, quiet_zone, bit_depth)
+
+    def write_svg(self, output: Union[str, TextIO], module_size: Optional[float] = None,
+                  quiet_zone: Optional[int] = None) -> int:
+        """
+        Writes the QR code as an SVG image, with one path for all the dark modules. See vector.py
+
+        :param output: A path, or a text file-like object
+        :param module_size: The width of a module in pixels, the instance's module size by default
+        :param quiet_zone: The width of the light border around the code in modules, the instance's one by default
+        :return: The number of characters written
+        """
+        module_size = self._module_size if module_size is None else module_size
+        quiet_zone = self._quiet_zone if quiet_zone is None else quiet_zone
+        matrix = self.get_matrix()
+
+        if isinstance(output, str):
+            with open(output, "w", encoding="ascii") as file:
+                return vector.write_svg(file, matrix, self._size, module_size, quiet_zone)
+        return vector.write_svg(output, matrix, self._size, module_size, quiet_zone)
+
+    def write_pdf(self, output: Union[str, BinaryIO], module_size: Optional[float] = None,
+                  quiet_zone: Optional[int] = None) -> int:
+        """
+        Writes the QR code as a single page PDF document, drawn with one path for all the dark modules. See vector.py
+
+        :param output: A path, or a binary file-like object
+        :param module_size: The width of a module in points, the instance's module size by default
+        :param quiet_zone: The width of the light border around the code in modules, the instance's one by default
+        :return: The number of bytes written
+        """
+        module_size = self._module_size if module_size is None else module_size
+        quiet_zone = self._quiet_zone if quiet_zone is None else quiet_zone
+        matrix = self.get_matrix()
+
+        if isinstance(output, str):
+            with open(output, "wb") as file:
+                return vector.write_pdf(file, matrix, self._size, module_size, quiet_zone)
+        return vector.write_pdf(output, matrix, self._size, module_size, quiet_zone)
+
+    def get_png(self) -> bytes:
+        """
+        Returns the image of the QR code encoded as PNG, from the cache when the same code was already rendered with the
+        same settings
+        """
+        key = None
+        if self._use_cache:
+            self._update(_MASK)
+            key = (self._symbol_key(), "png", self._module_size, self._quiet_zone, self._image_mode)
+            png = cache.renders.get(key)
+            if png is not None:
+                return png
+
+        buffer = io.BytesIO()
+        self.get_image().save(buffer, format="PNG")
+        png = buffer.getvalue()
+        if key is not None:
+            cache.renders.put(key, png, len(png))
+        return png
@@ -0,0 +1,473 @@
+"""
+Construction of the module matrix from the codewords, using only the standard library.
+
+This is everything between the codewords and the final matrix (function patterns, placement, masking and format
+information), written on bytes and bitboards so that workers that only need modules don't have to import numpy or PIL.
+image.QRImage builds its numpy tables from the same functions.
+
+Matrices are stored as size * size bytes in row-major order, 1 for dark modules.
+"""
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from constants import EC_LEVEL, ALIGNMENT_POSITIONS, FORMAT_INFORMATION, VERSION_INFORMATION
+import bitboard
+import encoding
+
+
+def draw_function_patterns(version: int) -> List[List[int]]:
+    """
+    Draws the function patterns (finder, timing, alignment, etc) of a version. Data modules are left to -1.
+    """
+    size = version * 4 + 17
+    matrix = [[-1 for _ in range(size)] for _ in range(size)]
+
+    def draw_timing_patterns():
+        # As defined in 7.3.4
+        # Vertical pattern
+        for y in range(size):
+            matrix[y][6] = (y + 1) % 2
+
+        # Horizontal pattern
+        for x in range(size):
+            matrix[6][x] = (x + 1) % 2
+
+    def draw_finder_patterns():
+        # As defined in 7.3.2
+        x_offset = [0, size - 7, 0]
+        y_offset = [0, 0, size - 7]
+
+        for pattern in range(3):
+            for x in range(7):
+                for y in range(7):
+                    color = 0
+
+                    if x in [0, 6] or y in [0, 6]:  # in outer pattern
+                        color = 1
+                    elif x not in [1, 5] and y not in [1, 5]:  # not in middle pattern (in inner pattern)
+                        color = 1
+
+                    matrix[y + y_offset[pattern]][x + x_offset[pattern]] = color
+
+    def draw_spacing_and_format():
+        # top left
+        for x in range(9):
+            matrix[7][x] = 0
+            matrix[8][x] = x == 6  # doesn't overwrite existing timing pattern
+        for y in range(9):
+            matrix[y][7] = 0
+            matrix[y][8] = y == 6
+
+        # top right
+        for x in range(size - 8, size):
+            matrix[7][x] = 0
+            matrix[8][x] = 0
+        for y in range(9):
+            matrix[y][size - 8] = 0
+
+        # bottom left
+        for y in range(size - 8, size):
+            matrix[y][7] = 0
+            matrix[y][8] = 0
+        for x in range(9):
+            matrix[size - 8][x] = x == 8  # write the format black module
+
+    def draw_alignment_patterns():
+        pos = ALIGNMENT_POSITIONS[version]
+
+        for pair in pos:
+            x_offset, y_offset = pair
+            for x in range(5):
+                for y in range(5):
+                    if x in [0, 4] or y in [0, 4] or x == y == 2:
+                        # outer square or inner dot
+                        matrix[y + y_offset][x + x_offset] = 1
+                    else:
+                        matrix[y + y_offset][x + x_offset] = 0
+
+    def draw_version_information():
+        version_info = VERSION_INFORMATION[version]
+
+        # top right
+        x = y = 0
+        for i in range(len(version_info)):
+            matrix[y + 5][size + x - 9] = int(version_info[i])
+
+            if x == -2:
+                x = 0
+                y -= 1
+            else:
+                x -= 1
+
+        # bottom left
+        x = y = 0
+        for i in range(len(version_info)):
+            matrix[size + y - 9][x + 5] = int(version_info[i])
+
+            if y == - 2:
+                y = 0
+                x -= 1
+            else:
+                y -= 1
+
+    draw_timing_patterns()
+    draw_finder_patterns()
+    draw_spacing_and_format()
+    if version > 1:
+        draw_alignment_patterns()  # not needed for version 1
+    if version >= 7:
+        draw_version_information()
+
+    # draw_spacing_and_format writes booleans, store everything as ints
+    return [[int(module) for module in row] for row in matrix]
+
+
+_templates: List[Optional[Tuple[bytes, bytes]]] = [None] * 41
+
+
+def function_template(version: int) -> Tuple[bytes, bytes]:
+    """
+    Returns the cached template of a version
+
+    :param version: The QR version
+    :return: A tuple (modules, protected) of size * size bytes. modules holds the function patterns with data modules
+    set to 0, protected is 1 for every function module (modules that must not be masked or written to)
+    """
+    if _templates[version] is None:
+        rows = draw_function_patterns(version)
+        modules = bytes(max(module, 0) for row in rows for module in row)
+        protected = bytes(module != -1 for row in rows for module in row)
+        _templates[version] = (modules, protected)
+    return _templates[version]
+
+
+_placement_orders: List[Optional[List[int]]] = [None] * 41
+
+
+def placement_order(version: int) -> List[int]:
+    """
+    Returns the positions (y * size + x) of the data modules of a version in placement order (the zigzag defined in
+    7.7.3), bit k of the codewords is written at position k of the list. Computed once per version.
+    """
+    if _placement_orders[version] is not None:
+        return _placement_orders[version]
+
+    size = version * 4 + 17
+    protected = function_template(version)[1]
+
+    def next_move(x: int, y: int) -> Tuple[int, int]:
+        """
+        Calculates the new position based on the current one.
+
+        :param x: The current x position
+        :param y: The current y position
+        :return: A tuple containing the new x and y coordinates
+        """
+        if x is None and y is None:
+            # initial
+            return size - 1, size - 1
+
+        # edge-case: transition between normal zone and left zone
+        if y == 0 and x == 7:
+            return 5, 0
+
+        if x >= 7:
+            # normal zone
+            up = ((x + 1) // 2) % 2 == 0  # boolean checking if we're moving up
+
+            if up:
+                if x % 2 == 0:
+                    # going left
+                    return x - 1, y
+                else:
+                    # going up right
+                    if y == 0:
+                        # already at top, switch lane
+                        return x - 1, y
+                    else:
+                        return x + 1, y - 1
+            else:
+                # down
+                if x % 2 == 0:
+                    # going left
+                    return x - 1, y
+                else:
+                    # going down right
+                    if y == size - 1:
+                        # bottom, switch lane
+                        return x - 1, y
+                    else:
+                        return x + 1, y + 1
+
+        else:
+            # left-most zone
+            up = x in [2, 3]
+
+            if up:
+                if x % 2 == 1:
+                    # going left
+                    return x - 1, y
+                else:
+                    # up-right
+                    if y == 0:
+                        # top
+                        return x - 1, y
+                    else:
+                        return x + 1, y - 1
+            else:
+                # down
+                if x % 2 == 1:
+                    return x - 1, y
+                else:
+                    if y == size - 1:
+                        return x - 1, y
+                    else:
+                        return x + 1, y + 1
+
+    order = []
+    x, y = next_move(None, None)
+    while True:
+        if not protected[y * size + x]:  # skip function modules (static pattern)
+            order.append(y * size + x)
+        if x == 0 and y == size - 1:
+            break  # last module of the left-most lane
+        x, y = next_move(x, y)
+
+    _placement_orders[version] = order
+    return order
+
+
+# Mask conditions of table 10, x is the column and y the row. Written with operators that also work on numpy arrays
+MASK_PATTERNS = [
+    lambda x, y: (y + x) % 2 == 0,
+    lambda x, y: y % 2 == 0,
+    lambda x, y: x % 3 == 0,
+    lambda x, y: (y + x) % 3 == 0,
+    lambda x, y: ((y // 2) + (x // 3)) % 2 == 0,
+    lambda x, y: (y * x) % 2 + (y * x) % 3 == 0,
+    lambda x, y: ((y * x) % 2 + (y * x) % 3) % 2 == 0,
+    lambda x, y: ((y + x) % 2 + (y * x) % 3) % 2 == 0,
+]
+
+_mask_tables: List[Optional[List[bytes]]] = [None] * 41
+
+
+def mask_patterns(version: int) -> List[bytes]:
+    """
+    Returns the 8 mask patterns of a version as size * size bytes. Function modules are always 0 so a mask is applied
+    with a single xor.
+    """
+    if _mask_tables[version] is None:
+        size = version * 4 + 17
+        protected = function_template(version)[1]
+        _mask_tables[version] = [
+            bytes(int(pattern(x, y) and not protected[y * size + x]) for y in range(size) for x in range(size))
+            for pattern in MASK_PATTERNS
+        ]
+    return _mask_tables[version]
+
+
+def format_positions(version: int) -> List[Tuple[int, int]]:
+    """
+    Returns the (row, column) of the format information modules (Figure 19), in the order of the values returned by
+    format_bits: both copies of the 15 format bits followed by the dark module.
+    """
+    size = version * 4 + 17
+    # left horizontal, then top vertical
+    first = [(8, x) for x in range(9) if x != 6] + [(y, 8) for y in range(7, -1, -1) if y != 6]
+    # bottom vertical, then right horizontal
+    second = [(y, 8) for y in range(size - 1, size - 8, -1)] + [(8, x) for x in range(size - 8, size)]
+    dark_module = [(size - 8, 8)]
+    return first + second + dark_module
+
+
+def format_bits(ec_level: EC_LEVEL) -> List[List[int]]:
+    """
+    Returns the module values written at format_positions for each mask
+    """
+    values = []
+    for info in FORMAT_INFORMATION[ec_level.name]:
+        bits = [int(bit) for bit in info]
+        values.append(bits + bits + [1])
+    return values
+
+
+_mask_bitboard_cache: List[Optional[List[Tuple[int, int]]]] = [None] * 41
+
+
+def mask_bitboards(version: int) -> List[Tuple[int, int]]:
+    """
+    Returns the (rows, columns) bitboards of the 8 mask patterns of a version
+    """
+    if _mask_bitboard_cache[version] is None:
+        size = version * 4 + 17
+        _mask_bitboard_cache[version] = [bitboard.from_modules(pattern, size) for pattern in mask_patterns(version)]
+    return _mask_bitboard_cache[version]
+
+
+_format_bitboard_cache: Dict[Tuple[int, EC_LEVEL], List[Tuple[int, int]]] = {}
+
+
+def format_bitboards(version: int, ec_level: EC_LEVEL) -> List[Tuple[int, int]]:
+    """
+    Returns the (rows, columns) bitboards of the format information for each mask. The dark module is left out since it
+    is already set in the template, so the result can be xored in.
+    """
+    key = (version, ec_level)
+    if key not in _format_bitboard_cache:
+        size = version * 4 + 17
+        positions = format_positions(version)[:-1]
+        boards = []
+        for values in format_bits(ec_level):
+            modules = bytearray(size * size)
+            for (y, x), value in zip(positions, values):
+                modules[y * size + x] = value
+            boards.append(bitboard.from_modules(modules, size))
+        _format_bitboard_cache[key] = boards
+    return _format_bitboard_cache[key]
+
+
+# Penalty rules in the order the mask search evaluates them, cheapest first: N4, N2, N1, N3. The first CHEAP_RULES are
+# scored for all the candidates at once before any candidate is abandoned
+RULE_ORDER = (3, 1, 0, 2)
+CHEAP_RULES = 2
+
+
+class MaskSearchStats:
+    """
+    Result of the last mask search of a QRImage. Work is counted in rule evaluations (8 masks x 4 rules for a full
+    search), the score is the full penalty of the chosen mask whatever the policy.
+    """
+
+    def __init__(self, policy: str = "exhaustive"):
+        self.policy = policy
+        self.mask: Optional[int] = None
+        self.score: Optional[int] = None
+        self.evaluated_rules = 0
+        self.skipped_rules = 0
+        self.skipped_masks = 0  # candidates abandoned before all their rules were scored
+
+    def __repr__(self):
+        return "MaskSearchStats(policy={!r}, mask={}, score={}, evaluated_rules={:d}, skipped_rules={:d}, " \
+               "skipped_masks={:d})".format(self.policy, self.mask, self.score, self.evaluated_rules,
+                                            self.skipped_rules, self.skipped_masks)
+
+
+def search_masks(score_rule: Callable[[List[int], int], Sequence[int]], stats: MaskSearchStats) -> Tuple[int, int]:
+    """
+    Finds the mask with the lowest penalty (lowest mask number on ties) without scoring every rule of every candidate.
+    Penalties are never negative, so a candidate is abandoned as soon as its partial score can't beat the best full
+    score found so far. The result is the same as scoring everything.
+
+    :param score_rule: Called with (masks, rule), returns the penalty of the rule for each of the masks
+    :param stats: Filled with the number of evaluated and skipped rules
+    :return: A tuple (best mask, its score)
+    """
+    masks = list(range(8))
+    partial = [0] * 8
+    for rule in RULE_ORDER[:CHEAP_RULES]:
+        for mask, score in zip(masks, score_rule(masks, rule)):
+            partial[mask] += int(score)
+    stats.evaluated_rules += 8 * CHEAP_RULES
+
+    # Candidates with the lowest partial scores are the most likely to win, scoring them first prunes the others sooner
+    remaining = RULE_ORDER[CHEAP_RULES:]
+    best = None  # (score, mask), compared as tuples so lower masks win ties
+    for position, mask in enumerate(sorted(masks, key=lambda m: (partial[m], m))):
+        if best is not None and (partial[mask], mask) > best:
+            # Every following candidate has a higher partial score too
+            abandoned = 8 - position
+            stats.skipped_masks += abandoned
+            stats.skipped_rules += abandoned * len(remaining)
+            break
+
+        score = partial[mask]
+        for evaluated, rule in enumerate(remaining):
+            if best is not None and (score, mask) > best:
+                stats.skipped_masks += 1
+                stats.skipped_rules += len(remaining) - evaluated
+                break
+            score += int(score_rule([mask], rule)[0])
+            stats.evaluated_rules += 1
+        else:
+            if best is None or (score, mask) < best:
+                best = (score, mask)
+
+    return best[1], best[0]
+
+
+def place_codewords(codewords: bytes, version: int) -> bytearray:
+    """
+    Writes the codewords over the template of a version, the modules left after them are the remainder bits (always 0)
+
+    :return: The unmasked matrix
+    """
+    modules = bytearray(function_template(version)[0])
+    bits = "{:0{}b}".format(int.from_bytes(codewords, "big"), len(codewords) * 8)
+    for position, bit in zip(placement_order(version), bits):
+        if bit == "1":
+            modules[position] = 1
+    return modules
+
+
+def apply_mask(unmasked: bytes, version: int, ec_level: EC_LEVEL, mask: int) -> bytes:
+    """
+    Masks a matrix with the given pattern and writes its format information
+    """
+    # Xor all the modules at once as big ints
+    masked = int.from_bytes(unmasked, "big") ^ int.from_bytes(mask_patterns(version)[mask], "big")
+    masked = bytearray(masked.to_bytes(len(unmasked), "big"))
+    size = version * 4 + 17
+    for (y, x), value in zip(format_positions(version), format_bits(ec_level)[mask]):
+        masked[y * size + x] = value
+    return bytes(masked)
+
+
+def bitboard_score_rule(unmasked: bytes, version: int, ec_level: EC_LEVEL) -> Callable[[List[int], int], List[int]]:
+    """
+    Returns the score_rule function of search_masks scoring the candidates on bitboards. Mask and format information
+    are applied by xoring bitboards, no candidate is built as a matrix
+    """
+    size = version * 4 + 17
+    rows, cols = bitboard.from_modules(unmasked, size)
+    masks = mask_bitboards(version)
+    formats = format_bitboards(version, ec_level)
+    boards = [(rows ^ masks[i][0] ^ formats[i][0], cols ^ masks[i][1] ^ formats[i][1]) for i in range(8)]
+
+    def score_rule(indexes: List[int], rule: int) -> List[int]:
+        return [bitboard.rule_score(*boards[i], size, rule) for i in indexes]
+
+    return score_rule
+
+
+def best_mask(unmasked: bytes, version: int, ec_level: EC_LEVEL, stats: Optional[MaskSearchStats] = None) -> int:
+    """
+    Finds the mask with the lowest penalty on bitboards, see search_masks
+    """
+    score_rule = bitboard_score_rule(unmasked, version, ec_level)
+    return search_masks(score_rule, MaskSearchStats() if stats is None else stats)[0]
+
+
+def encode_matrix(message: encoding.Message, version: Optional[Union[int, str]] = None,
+                  ec_level: Union[EC_LEVEL, str] = EC_LEVEL.L, mask: int = -1,
+                  boost_ec_level: bool = False) -> Tuple[int, EC_LEVEL, int, bytes]:
+    """
+    Encodes a message into its final module matrix, without numpy or PIL
+
+    :param message: The message to encode, text or a binary payload
+    :param version: The QR version to use, None or "auto" to use the smallest version that can hold the message
+    :param ec_level: The error correction level to use (the minimum one when the version is automatic)
+    :param mask: The mask pattern to use, -1 to select the best one
+    :param boost_ec_level: With an automatic version, use the highest EC level that fits in the selected version
+    :return: A tuple (version, ec level, mask, modules). modules holds size * size bytes in row-major order, 1 for
+    dark modules
+    :raise encoding.EncodingError: if the message can't be encoded
+    :raise ValueError: if the message is too long for the version and error correction level
+    """
+    ec_level = EC_LEVEL[ec_level] if type(ec_level) is str else ec_level  # Cast to enum if needed
+    message = encoding.as_payload(message)
+    if version in (None, "auto"):
+        version, ec_level = encoding.select_version(message, ec_level, boost_ec_level)
+    unmasked = place_codewords(encoding.generate_codewords(message, version, ec_level), version)
+    if mask == -1:
+        mask = best_mask(unmasked, version, ec_level)
+    return version, ec_level, mask, apply_mask(unmasked, version, ec_level, mask)
@@ -0,0 +1,131 @@
+"""
+Vectorized evaluation of the mask penalty rules (7.8.3). Every function takes a stack of candidate matrices with shape
+(masks, size, size) and returns one score per candidate, so the 8 masks of a symbol are scored in a single call.
+"""
+import numpy
+
+# 1:1:3:1:1 pattern preceded or followed by 4 light modules, packed as 11-bit integers (first module is the MSB)
+FINDER_BEFORE = 0b00001011101
+FINDER_AFTER = 0b10111010000
+
+
+def _runs(lines: numpy.ndarray) -> numpy.ndarray:
+    """
+    N1: 3 + (length - 5) points for every run of 5+ same colored modules along the last axis
+    """
+    count, lines_per_matrix, size = lines.shape
+    lines = lines.reshape(count * lines_per_matrix, size)
+
+    # A boundary is the start of a run, the end of every line is also marked so runs never span 2 lines
+    boundaries = numpy.ones((lines.shape[0], size + 1), dtype=bool)
+    boundaries[:, 1:size] = lines[:, 1:] != lines[:, :-1]
+    positions = numpy.flatnonzero(boundaries)
+
+    # Distance between 2 boundaries is the length of a run. The end of a line and the start of the next one are
+    # adjacent, giving a fake run of length 1 which never scores
+    lengths = numpy.diff(positions)
+    scoring = lengths >= 5
+    matrix = positions[:-1][scoring] // (lines_per_matrix * (size + 1))
+    return numpy.bincount(matrix, weights=lengths[scoring] - 2, minlength=count).astype(numpy.int64)
+
+
+def _boxes(candidates: numpy.ndarray) -> numpy.ndarray:
+    """
+    N2: 3 points for every 2x2 block of same colored modules (blocks can overlap)
+    """
+    return _stacked_boxes(candidates[:, :-1], candidates[:, 1:])
+
+
+def _stacked_boxes(tops: numpy.ndarray, bottoms: numpy.ndarray) -> numpy.ndarray:
+    """
+    N2 for blocks made of line i of tops and line i of bottoms
+    """
+    top_left = tops[:, :, :-1]
+    same = (top_left == tops[:, :, 1:]) & (top_left == bottoms[:, :, :-1]) & (top_left == bottoms[:, :, 1:])
+    return same.sum(axis=(1, 2)) * 3
+
+
+def _finder_like(lines: numpy.ndarray) -> numpy.ndarray:
+    """
+    N3: 40 points for every finder-like pattern along the last axis
+    """
+    size = lines.shape[-1]
+    windows = size - 10  # number of 11 module windows in a line
+
+    # Pack every window into an integer by adding the shifted lines together
+    packed = numpy.zeros(lines.shape[:-1] + (windows,), dtype=numpy.int32)
+    for offset in range(11):
+        packed <<= 1
+        packed |= lines[..., offset:offset + windows]
+
+    matches = (packed == FINDER_BEFORE) | (packed == FINDER_AFTER)
+    return matches.sum(axis=(1, 2)) * 40
+
+
+def _proportion(candidates: numpy.ndarray) -> numpy.ndarray:
+    """
+    N4: 10 points for every 5% step the proportion of dark modules deviates from 50%
+    """
+    total = candidates.shape[1] * candidates.shape[2]
+    dark = candidates.sum(axis=(1, 2), dtype=numpy.int64)
+
+    # Number of full 5% steps, computed on integers: |dark / total - 50%| > 5% * steps
+    deviation = numpy.abs(dark * 100 - total * 50)
+    steps = numpy.maximum(0, -(-deviation // (5 * total)) - 1)
+    return steps * 10
+
+
+def rule_scores(candidates: numpy.ndarray, rule: int) -> numpy.ndarray:
+    """
+    Scores a single penalty rule on a stack of masked matrices
+
+    :param candidates: uint8 array of shape (masks, size, size) containing 0 and 1 modules
+    :param rule: The rule to evaluate, 0 to 3 for N1 to N4
+    :return: int array of shape (masks,) holding the penalty of each candidate
+    """
+    if rule == 0:
+        return _runs(candidates) + _runs(candidates.transpose(0, 2, 1))
+    if rule == 1:
+        return _boxes(candidates)
+    if rule == 2:
+        return _finder_like(candidates) + _finder_like(candidates.transpose(0, 2, 1))
+    return _proportion(candidates)
+
+
+def penalty_scores(candidates: numpy.ndarray) -> numpy.ndarray:
+    """
+    Scores a stack of masked matrices
+
+    :param candidates: uint8 array of shape (masks, size, size) containing 0 and 1 modules
+    :return: int array of shape (masks, 4) holding the N1, N2, N3 and N4 penalties of each candidate
+    """
+    candidates = numpy.asarray(candidates, dtype=numpy.uint8)
+    columns = candidates.transpose(0, 2, 1)
+
+    return numpy.stack([
+        _runs(candidates) + _runs(columns),
+        _boxes(candidates),
+        _finder_like(candidates) + _finder_like(columns),
+        _proportion(candidates),
+    ], axis=1).astype(numpy.int64)
+
+
+def sampled_scores(candidates: numpy.ndarray, step: int) -> numpy.ndarray:
+    """
+    Estimates the penalties of a stack of masked matrices from every step-th row and column. N1 to N3 are scaled back
+    to the size of the whole matrix so the estimate stays comparable to penalty_scores.
+
+    :param candidates: uint8 array of shape (masks, size, size) containing 0 and 1 modules
+    :param step: The distance between 2 sampled lines, 1 scores the whole matrices
+    :return: int array of shape (masks, 4) holding the estimated N1, N2, N3 and N4 penalties of each candidate
+    """
+    candidates = numpy.asarray(candidates, dtype=numpy.uint8)
+    rows = candidates[:, ::step]
+    columns = candidates[:, :, ::step].transpose(0, 2, 1)
+
+    return numpy.stack([
+        (_runs(rows) + _runs(columns)) * step,
+        _stacked_boxes(candidates[:, :-1:step], candidates[:, 1::step]) * step,
+        (_finder_like(rows) + _finder_like(columns)) * step,
+        _proportion(rows),
+    ], axis=1).astype(numpy.int64)
@@ -0,0 +1,264 @@
+"""
+Streaming generation of QR codes: source -> symbol (encode, place and mask) -> render -> sink.
+
+Items are pulled from the source only when there is room in the pipeline, so at most `max_in_flight` items exist at any
+time whatever the size of the job.
+"""
+import csv
+import io
+import os
+import tarfile
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from batch import GenerationError
+from constants import EC_LEVEL
+from image import QRImage
+
+STAGES = ("read", "symbol", "render", "write")
+
+
+class StageCounter:
+    def __init__(self):
+        self.items = 0
+        self.seconds = 0.0
+
+    @property
+    def items_per_second(self) -> float:
+        return self.items / self.seconds if self.seconds else 0.0
+
+
+class PipelineStats:
+    """
+    Counters of a pipeline run. Stage times are the time spent inside the stage, summed over the workers
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, StageCounter] = {stage: StageCounter() for stage in STAGES}
+        self.errors: List[Tuple[str, GenerationError]] = []  # (key, error) of the items that failed
+        self.seconds = 0.0  # wall clock time of the run
+
+    @property
+    def items(self) -> int:
+        return self.stages["write"].items
+
+    @property
+    def items_per_second(self) -> float:
+        return self.items / self.seconds if self.seconds else 0.0
+
+
+# Sources
+
+def read_lines(path: str, encoding: str = "utf-8") -> Iterator[str]:
+    """
+    Yields every non-empty line of a newline delimited file
+    """
+    with open(path, encoding=encoding) as file:
+        for line in file:
+            line = line.rstrip("\r\n")
+            if line:
+                yield line
+
+
+def read_csv(path: str, message_column: Union[int, str] = 0, key_column: Union[int, str, None] = None,
+             encoding: str = "utf-8", **reader_options) -> Iterator[Tuple[str, str]]:
+    """
+    Yields (key, message) tuples from a CSV file. Columns are either indexes or header names, in which case the first
+    row is read as the header. Without key column, the row number is used as key.
+    """
+    with open(path, newline="", encoding=encoding) as file:
+        if isinstance(message_column, str) or isinstance(key_column, str):
+            reader = csv.DictReader(file, **reader_options)
+        else:
+            reader = csv.reader(file, **reader_options)
+        for number, row in enumerate(reader):
+            key = str(number) if key_column is None else row[key_column]
+            yield key, row[message_column]
+
+
+# Sinks. A sink is any callable taking (key, png bytes), close() is called at the end of the run if it exists
+
+class DirectorySink:
+    """
+    Writes every code as a PNG file in a directory
+    """
+
+    def __init__(self, path: str, name: str = "{key}.png"):
+        os.makedirs(path, exist_ok=True)
+        self._path = path
+        self._name = name
+
+    def __call__(self, key: str, png: bytes):
+        with open(os.path.join(self._path, self._name.format(key=key)), "wb") as file:
+            file.write(png)
+
+
+class TarSink:
+    """
+    Streams the codes to a tar archive, works with non seekable outputs (pipes, sockets)
+    """
+
+    def __init__(self, output: Union[str, BinaryIO], name: str = "{key}.png"):
+        if isinstance(output, str):
+            self._tar = tarfile.open(output, mode="w")
+        else:
+            self._tar = tarfile.open(fileobj=output, mode="w|")
+        self._name = name
+
+    def __call__(self, key: str, png: bytes):
+        info = tarfile.TarInfo(self._name.format(key=key))
+        info.size = len(png)
+        info.mtime = int(time.time())
+        self._tar.addfile(info, io.BytesIO(png))
+
+    def close(self):
+        self._tar.close()
+
+
+class ZipSink:
+    """
+    Streams the codes to a zip archive. PNG data is already compressed so files are stored as is
+    """
+
+    def __init__(self, output: Union[str, BinaryIO], name: str = "{key}.png"):
+        self._zip = zipfile.ZipFile(output, mode="w", compression=zipfile.ZIP_STORED)
+        self._name = name
+
+    def __call__(self, key: str, png: bytes):
+        self._zip.writestr(self._name.format(key=key), png)
+
+    def close(self):
+        self._zip.close()
+
+
+# Processing
+
+def _process_chunk(chunk: List[Tuple[int, str, str]], settings: dict) -> Tuple[list, float, float]:
+    """
+    Builds and renders a chunk of (position, key, message) items
+
+    :return: A tuple (results, symbol seconds, render seconds), results holds a (key, png bytes or GenerationError)
+    tuple per item
+    """
+    results = []
+    symbol_seconds = render_seconds = 0.0
+    for position, key, message in chunk:
+        start = time.perf_counter()
+        try:
+            code = QRImage(settings["version"], settings["ec_level"], message, **settings["options"])
+            built = time.perf_counter()
+            symbol_seconds += built - start
+
+            png = code.get_png()
+            render_seconds += time.perf_counter() - built
+            results.append((key, png))
+        except Exception as e:
+            results.append((key, GenerationError(position, "{}: {}".format(type(e).__name__, e))))
+    return results, symbol_seconds, render_seconds
+
+
+def _keyed(source: Iterable[Union[str, Tuple[str, str]]]) -> Iterator[Tuple[int, str, str]]:
+    """
+    Yields (position, key, message) for every item of the source, items without key get their position as key
+    """
+    for index, item in enumerate(source):
+        if isinstance(item, tuple):
+            yield (index,) + item
+        else:
+            yield index, str(index), item
+
+
+def run_pipeline(source: Iterable[Union[str, Tuple[str, str]]], sink: Callable[[str, bytes], None],
+                 version: Optional[Union[int, str]] = None, ec_level: Union[EC_LEVEL, str] = EC_LEVEL.L,
+                 workers: int = 1, max_in_flight: int = 256, chunk_size: int = 16,
+                 on_error: Optional[Callable[[str, GenerationError], None]] = None, **options) -> PipelineStats:
+    """
+    Generates a QR code for every item of the source and passes them to the sink in source order
+
+    :param source: The messages, or (key, message) tuples. Keys default to the position of the message
+    :param sink: Called with (key, png bytes) for every code, see DirectorySink, TarSink and ZipSink
+    :param version: The QR version to use, None or "auto" to select it for each message
+    :param ec_level: The error correction level to use
+    :param workers: The number of worker processes building and rendering the codes, 1 works in this process
+    :param max_in_flight: The maximum number of items read from the source but not written to the sink yet
+    :param chunk_size: The number of items sent to a worker at once
+    :param on_error: Called with (key, error) for every item that failed, errors are also kept in the stats. The index
+    of the error is the position of the item in the source
+    :param options: Other arguments passed to QRImage (mask, mask_policy, score_backend, use_cache, ...)
+    :return: The counters of the run
+    """
+    stats = PipelineStats()
+    settings = {"version": version, "ec_level": ec_level, "options": options}
+    chunk_size = max(1, min(chunk_size, max_in_flight))
+    start = time.perf_counter()
+
+    def read_chunks() -> Iterator[List[Tuple[int, str, str]]]:
+        items = _keyed(source)
+        while True:
+            read_start = time.perf_counter()
+            chunk = []
+            for item in items:
+                chunk.append(item)
+                if len(chunk) == chunk_size:
+                    break
+            stats.stages["read"].seconds += time.perf_counter() - read_start
+            stats.stages["read"].items += len(chunk)
+            if not chunk:
+                return
+            yield chunk
+
+    def collect(future, chunk: List[Tuple[int, str, str]]):
+        try:
+            results = future.result()
+        except Exception as e:
+            # The worker died (or the results couldn't be sent back), every item of the chunk failed
+            error = "{}: {}".format(type(e).__name__, e)
+            results = [(key, GenerationError(position, error)) for position, key, _ in chunk], 0.0, 0.0
+        write(*results)  # errors of the sink and on_error are raised to the caller
+
+    def write(results: list, symbol_seconds: float, render_seconds: float):
+        stats.stages["symbol"].seconds += symbol_seconds
+        stats.stages["render"].seconds += render_seconds
+        for key, result in results:
+            if isinstance(result, GenerationError):
+                stats.errors.append((key, result))
+                if on_error is not None:
+                    on_error(key, result)
+                continue
+            stats.stages["symbol"].items += 1
+            stats.stages["render"].items += 1
+
+            write_start = time.perf_counter()
+            sink(key, result)
+            stats.stages["write"].seconds += time.perf_counter() - write_start
+            stats.stages["write"].items += 1
+
+    try:
+        if workers == 1:
+            for chunk in read_chunks():
+                write(*_process_chunk(chunk, settings))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                # Futures are written in submission order. When the window is full, wait for the oldest one before
+                # reading more from the source (backpressure)
+                pending: Deque = deque()
+                in_flight = 0
+                for chunk in read_chunks():
+                    pending.append((executor.submit(_process_chunk, chunk, settings), chunk))
+                    in_flight += len(chunk)
+                    while in_flight + chunk_size > max_in_flight and pending:
+                        future, done = pending.popleft()
+                        collect(future, done)
+                        in_flight -= len(done)
+                while pending:
+                    collect(*pending.popleft())
+    finally:
+        close = getattr(sink, "close", None)
+        if close is not None:
+            close()
+        stats.seconds = time.perf_counter() - start
+
+    return stats
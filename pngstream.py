@@ -0,0 +1,92 @@
+"""
+Streaming PNG encoder for QR codes, using only the standard library.
+
+The image is written one module row at a time: the scanline of a row is built once, repeated for every pixel row of
+the module and fed to an incremental zlib compressor, and compressed data is written out in IDAT chunks as soon as
+enough of it is available. Memory use depends on the width of the image, never on its height.
+"""
+import struct
+import zlib
+from typing import BinaryIO, Iterable, Sequence
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+BIT_DEPTHS = (1, 8)
+
+# Compressed bytes buffered before an IDAT chunk is written
+IDAT_SIZE = 64 * 1024
+
+
+def _chunk(output: BinaryIO, kind: bytes, data: bytes) -> int:
+    output.write(struct.pack(">I", len(data)))
+    output.write(kind)
+    output.write(data)
+    output.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(kind))))
+    return len(data) + 12
+
+
+def _scanline(modules: Sequence[int], module_size: int, quiet_zone: int, bit_depth: int) -> bytes:
+    """
+    Builds the filtered scanline (filter type 0) of a row of modules, dark modules are black
+    """
+    if bit_depth == 1:
+        dark, light = "0" * module_size, "1" * module_size
+        bits = light * quiet_zone + "".join(dark if module else light for module in modules) + light * quiet_zone
+        padding = -len(bits) % 8
+        return b"\x00" + (int(bits, 2) << padding).to_bytes((len(bits) + padding) // 8, "big")
+
+    dark, light = b"\x00" * module_size, b"\xff" * module_size
+    return b"\x00" + light * quiet_zone + b"".join(dark if module else light for module in modules) + light * quiet_zone
+
+
+def write_png(output: BinaryIO, matrix: Iterable[Sequence[int]], size: int, module_size: int = 1, quiet_zone: int = 4,
+              bit_depth: int = 1, compression: int = 6) -> int:
+    """
+    Writes a QR code as a grayscale PNG image
+
+    :param output: A binary file-like object, only write() is used so pipes and sockets work too
+    :param matrix: The rows of modules (1 for dark modules), read one at a time
+    :param size: The number of modules in a row
+    :param module_size: The width of a module in pixels
+    :param quiet_zone: The width of the light border around the code, in modules
+    :param bit_depth: 1 for a black and white image, 8 for an 8-bit grayscale image
+    :param compression: The zlib compression level
+    :return: The number of bytes written
+    """
+    if bit_depth not in BIT_DEPTHS:
+        raise ValueError("Unknown bit depth, must be one of " + ", ".join(map(str, BIT_DEPTHS)))
+
+    width = (size + 2 * quiet_zone) * module_size
+    output.write(PNG_SIGNATURE)
+    written = len(PNG_SIGNATURE)
+    # Width, height, bit depth, color type (0 = grayscale), compression, filter and interlace methods
+    written += _chunk(output, b"IHDR", struct.pack(">IIBBBBB", width, width, bit_depth, 0, 0, 0, 0))
+
+    compressor = zlib.compressobj(compression)
+    pending = []
+    pending_size = 0
+
+    def feed(scanline: bytes, count: int):
+        nonlocal pending_size, written
+        # Every pixel row of a module row is the same scanline
+        for _ in range(count):
+            data = compressor.compress(scanline)
+            if data:
+                pending.append(data)
+                pending_size += len(data)
+        if pending_size >= IDAT_SIZE:
+            written += _chunk(output, b"IDAT", b"".join(pending))
+            pending.clear()
+            pending_size = 0
+
+    light_row = _scanline([0] * size, module_size, quiet_zone, bit_depth)
+    for _ in range(quiet_zone):
+        feed(light_row, module_size)
+    for row in matrix:
+        feed(_scanline(row, module_size, quiet_zone, bit_depth), module_size)
+    for _ in range(quiet_zone):
+        feed(light_row, module_size)
+
+    pending.append(compressor.flush())
+    written += _chunk(output, b"IDAT", b"".join(pending))
+    written += _chunk(output, b"IEND", b"")
+    return written
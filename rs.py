@@ -1,5 +1,13 @@
 from __future__ import annotations
-from typing import List, Optional
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+from constants import GF_EXP, GF_LOG
+
+if TYPE_CHECKING:
+    import numpy  # only needed by the batch encoder, imported on first use
+
+gf_exp = GF_EXP  # doubled so that gf_exp[log a + log b] never overflows
+gf_log = GF_LOG
 
 
 # Basic GF operations
@@ -53,7 +61,7 @@ class RSPolynomial:
 
     def set_term(self, term: int, index: int):
         new_terms = self.terms
-        if len(self.terms) < index:
+        if len(self.terms) <= index:
             # pad terms to make room for new term
             new_terms += [0] * (index - len(self.terms) + 1)
 
@@ -92,44 +100,119 @@ def rs_generator_poly(n: int) -> RSPolynomial:
         return poly
 
 
-def message_poly(codewords: List[str]):
+def message_poly(codewords: bytes):
     length = len(codewords)
     msg_poly = RSPolynomial()
     for i in range(length):
         # ax^n-1 + bx^n-2 + ... + (n-1)x^0
-        msg_poly.set_term(int(codewords[i], 2), length - i - 1)  # Converting binary codewords to decimal
+        msg_poly.set_term(codewords[i], length - i - 1)
     return msg_poly
 
 
-def create_ecc_block(codewords: List[str], ecc_amount: int) -> str:
+def create_ecc_block_reference(codewords: bytes, ecc_amount: int) -> bytes:
     """
-    Creates the ECCs for a block
+    Creates the ECCs for a block using polynomial division. Slow, kept as the reference for create_ecc_block.
 
     :param codewords: The data codewords to use
     :param ecc_amount: The number of EC codewords to generate
-    :return: The ECCs as a string
+    :return: The ECCs as bytes
     """
     msg_poly = message_poly(codewords)
     gen_poly = rs_generator_poly(ecc_amount)
 
-    rs_codewords = gf_polynomial_division(msg_poly, gen_poly)
-    rs_codewords = ["{0:08b}".format(i) for i in rs_codewords]  # convert from base 10 to binary
-    return "".join(rs_codewords)  # convert list to string
+    return bytes(gf_polynomial_division(msg_poly, gen_poly))
+
+
+generator_logs: List[Optional[List[int]]] = [None] * 69
+lfsr_tables: List[Optional[List[int]]] = [None] * 69
+
+
+def rs_generator_log(n: int) -> List[int]:
+    """
+    Returns the generator polynomial of degree n in log form, highest degree first and without the leading term (always
+    1). These are the taps of the shift register used by create_ecc_block.
+    """
+    if generator_logs[n] is None:
+        terms = rs_generator_poly(n).get_inversed_terms()[1:]
+        generator_logs[n] = [gf_log[term] for term in terms]  # generator terms are never 0
+    return generator_logs[n]
 
 
-gf_exp = [0] * 256
-gf_log = [0] * 256
+def rs_lfsr_table(n: int) -> List[int]:
+    """
+    Returns the feedback table of the shift register for n EC codewords. Entry f is the product of f with every tap of
+    the generator polynomial, packed big-endian in a n-byte integer so a whole register update is a single xor.
+    """
+    if lfsr_tables[n] is None:
+        taps = rs_generator_log(n)
+        table = [0] * 256
+        for factor in range(1, 256):
+            log_factor = gf_log[factor]
+            # gf_exp is doubled so the sum of two logs never needs to be reduced mod 255
+            table[factor] = int.from_bytes(bytes(gf_exp[log_factor + tap] for tap in taps), "big")
+        lfsr_tables[n] = table
+    return lfsr_tables[n]
+
+
+def create_ecc_block(codewords: bytes, ecc_amount: int) -> bytes:
+    """
+    Creates the ECCs for a block
 
+    :param codewords: The data codewords to use
+    :param ecc_amount: The number of EC codewords to generate
+    :return: The ECCs as bytes
+    """
+    table = rs_lfsr_table(ecc_amount)
+    shift = 8 * (ecc_amount - 1)
+    register_mask = (1 << (8 * ecc_amount)) - 1
+
+    # The register holds the running remainder, its first byte is the coefficient leaving the register
+    register = 0
+    for codeword in codewords:
+        feedback = (register >> shift) ^ codeword
+        register = ((register << 8) & register_mask) ^ table[feedback]
+
+    return register.to_bytes(ecc_amount, "big")
+
+
+batch_tables: Dict[int, numpy.ndarray] = {}
+
+
+def rs_batch_table(n: int) -> numpy.ndarray:
+    """
+    Returns the feedback table used by create_ecc_blocks as a (256, n) uint8 array. Row f holds the product of f with
+    every tap of the generator polynomial, same as rs_lfsr_table but unpacked.
+    """
+    if n not in batch_tables:
+        import numpy
+
+        table = rs_lfsr_table(n)
+        batch_tables[n] = numpy.array([list(row.to_bytes(n, "big")) for row in table], dtype=numpy.uint8)
+    return batch_tables[n]
+
+
+def create_ecc_blocks(blocks: numpy.ndarray, ecc_amount: int) -> numpy.ndarray:
+    """
+    Creates the ECCs for many blocks at once. The shift register of create_ecc_block is run on every block in parallel,
+    one data column at a time.
+
+    :param blocks: 2-D uint8 array of data codewords, one block per row. All blocks must have the same length
+    :param ecc_amount: The number of EC codewords to generate per block
+    :return: 2-D uint8 array of shape (number of blocks, ecc_amount)
+    """
+    import numpy
 
-def fill_tables():
-    exp = 1
-    for i in range(256):
-        gf_exp[i] = exp
-        gf_log[exp] = i
+    blocks = numpy.asarray(blocks, dtype=numpy.uint8)
+    if blocks.ndim != 2:
+        raise ValueError("blocks must be a 2-D array")
 
-        exp *= 2
-        exp = exp ^ 285 if exp > 255 else exp
-    gf_log[1] = 0  # manually setting log(1) to 0 because it'd show 255 otherwise
+    table = rs_batch_table(ecc_amount)
+    register = numpy.zeros((blocks.shape[0], ecc_amount), dtype=numpy.uint8)
 
+    for column in range(blocks.shape[1]):
+        feedback = register[:, 0] ^ blocks[:, column]
+        register[:, :-1] = register[:, 1:]
+        register[:, -1] = 0
+        register ^= table[feedback]
 
-fill_tables()
+    return register
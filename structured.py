@@ -0,0 +1,278 @@
+"""
+Structured Append: a message is split across up to 16 symbols that readers put back together, for messages too large
+for a single symbol or to keep symbols small enough to print and scan quickly.
+
+The split is planned on the segmentation of the whole message. Cutting its runs between two characters estimates the
+length of both parts, so the longest part for a version is found with a binary search instead of segmenting every
+candidate part. Parts are segmented again when encoded, possibly with another charset, so the cuts of the chosen
+version are then checked against the actual encoding of the parts and moved back if needed. Every symbol also holds a
+20-bit header with its position, the number of symbols and the parity of the message.
+"""
+from __future__ import annotations
+
+import bisect
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple, Union
+
+import numpy
+
+from constants import CCI_LENGTH, DATA_MODE, EC_LEVEL, STREAM_LENGTH
+import encoding
+from image import QRImage
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+OBJECTIVES = ("modules", "version")
+OUTPUTS = ("matrix", "image")
+
+# Mode indicator and header of the Structured Append segment, and of the ECI segment of UTF-8 text
+_HEADER_BITS = 4 + 16
+_ECI_BITS = 4 + 8
+
+# First version of every group of versions sharing the same CCI lengths
+_GROUP_FIRST = [0] + [1] * 9 + [10] * 17 + [27] * 14
+
+
+class _Layout:
+    """
+    Estimated stream length of any part of a message, from the segmentation of the whole message for a group of
+    versions
+    """
+
+    def __init__(self, message: Union[str, bytes], version: int):
+        self._ranges, charset = encoding.segment_ranges(message, version)
+        self._starts = [start for _, start, _ in self._ranges]
+        self._heads = [4 + CCI_LENGTH.get(mode)[version] for mode, _, _ in self._ranges]
+        self._eci = charset == "utf-8"
+
+        # Bytes before every character, UTF-8 text takes several bytes per character in byte mode
+        self._offsets: Optional[List[int]] = None
+        if self._eci:
+            self._offsets = [0]
+            for char in message:
+                self._offsets.append(self._offsets[-1] + len(char.encode("utf-8")))
+
+        # Length of every run written whole, summed so that the runs inside a part are added in constant time
+        self._totals = [0]
+        for i in range(len(self._ranges)):
+            self._totals.append(self._totals[-1] + self._run_bit_length(i, *self._ranges[i][1:]))
+
+    def _run_bit_length(self, i: int, start: int, end: int) -> int:
+        mode = self._ranges[i][0]
+        count = end - start
+        if mode == DATA_MODE.Byte and self._offsets is not None:
+            count = self._offsets[end] - self._offsets[start]
+        return self._heads[i] + encoding.character_bit_length(count, mode)
+
+    def bit_length(self, start: int, end: int) -> int:
+        """
+        Returns the estimated stream length of the characters between start and end, header included
+        """
+        length = _HEADER_BITS + (_ECI_BITS if self._eci else 0)
+        if start == end:
+            return length
+        first = bisect.bisect_right(self._starts, start) - 1
+        last = bisect.bisect_left(self._starts, end) - 1
+        if first == last:
+            return length + self._run_bit_length(first, start, end)
+        return (length + self._run_bit_length(first, start, self._ranges[first][2]) +
+                self._totals[last] - self._totals[first + 1] + self._run_bit_length(last, self._starts[last], end))
+
+
+def _plan(message: Union[str, bytes], ec: EC_LEVEL, max_symbols: int, max_version: int,
+          objective: str) -> List[Tuple[int, int]]:
+    """
+    Picks where to cut the message. For every version, parts as long as the version can hold are taken one after the
+    other, and the version giving the best objective is kept. Its parts are shortened if their actual encoding doesn't
+    fit the version, the next best version is used if the message then needs too many symbols
+
+    :return: The (start, end) of every part
+    :raise ValueError: if the message doesn't fit in max_symbols symbols of at most max_version
+    """
+    capacities = [0] + [STREAM_LENGTH.get(str(version) + ec.name) for version in range(1, 41)]
+    layouts: Dict[int, _Layout] = {}
+
+    def layout(version: int) -> _Layout:
+        first = _GROUP_FIRST[version]
+        if first not in layouts:
+            layouts[first] = _Layout(message, first)
+        return layouts[first]
+
+    def smallest_version(start: int, end: int, largest: int) -> int:
+        for version in range(1, largest + 1):
+            if layout(version).bit_length(start, end) <= capacities[version]:
+                return version
+        return largest
+
+    lengths: Dict[Tuple[int, int, int], int] = {}
+
+    def fits(start: int, end: int, version: int) -> bool:
+        # Parts are segmented again when encoded, the header takes the same space whatever its values
+        key = (start, end, _GROUP_FIRST[version])
+        if key not in lengths:
+            lengths[key] = encoding.stream_bit_length(message[start:end], key[2], (0, 1, 0))
+        return lengths[key] <= capacities[version]
+
+    def longest_part(start: int, end: int, part_fits: Callable[[int], bool]) -> int:
+        # Largest end of a part starting at start, at most end, that fits
+        low, high = start, end
+        while low < high:
+            middle = (low + high + 1) // 2
+            if part_fits(middle):
+                low = middle
+            else:
+                high = middle - 1
+        return low
+
+    def cut(version: int, check: bool) -> Optional[List[Tuple[int, int]]]:
+        bit_length = layout(version).bit_length
+        cuts = []
+        start = 0
+        while start < len(message) and len(cuts) < max_symbols:
+            # Longest part starting at start that fits, the length of a part only grows with its end
+            end = longest_part(start, len(message), lambda end: bit_length(start, end) <= capacities[version])
+            if check and end > start and not fits(start, end, version):
+                end = longest_part(start, end - 1, lambda end: fits(start, end, version))
+            if end == start:
+                break
+            cuts.append((start, end))
+            start = end
+        if start < len(message):
+            return None  # too small for the message
+        return cuts or [(0, 0)]
+
+    # Versions are ranked on the estimated lengths, then the cuts of the best one are checked against the actual
+    # encoding of the parts, moving a cut back when the estimate was too short
+    scores = []
+    for version in range(1, max_version + 1):
+        cuts = cut(version, False)
+        if cuts is None:
+            continue
+        versions = [smallest_version(start, end, version) for start, end in cuts]
+        modules = sum((v * 4 + 17) ** 2 for v in versions)
+        scores.append(((modules, max(versions)) if objective == "modules" else (max(versions), modules), version))
+
+    for _, version in sorted(scores):
+        cuts = cut(version, True)
+        if cuts is not None:
+            return cuts
+    raise ValueError("The message to encode is too large for {:d} symbols of at most version {:d} at the "
+                     "specified EC level.".format(max_symbols, max_version))
+
+
+def split_message(message: encoding.Message, ec_level: Union[EC_LEVEL, str] = EC_LEVEL.L,
+                  max_symbols: int = encoding.MAX_STRUCTURED_APPEND, objective: str = "modules",
+                  max_version: int = 40) -> List[Tuple[Union[str, bytes], Tuple[int, int, int]]]:
+    """
+    Splits a message into the parts of a Structured Append message
+
+    :param message: The message to split, text or a binary payload
+    :param ec_level: The error correction level of the symbols
+    :param max_symbols: The maximum number of symbols, at most 16
+    :param objective: "modules" to minimize the total number of modules (fewer, larger symbols) or "version" to
+    minimize the version of the largest symbol (more, smaller symbols)
+    :param max_version: The largest version a symbol can use
+    :raise encoding.EncodingError: if the message can't be encoded
+    :raise ValueError: if the message doesn't fit in max_symbols symbols of at most max_version
+    :return: A (part, structured_append) tuple per symbol, to pass as the message and structured_append arguments of
+    QRImage
+    """
+    if objective not in OBJECTIVES:
+        raise ValueError("Unknown objective, must be one of " + ", ".join(OBJECTIVES))
+    if not 1 <= max_symbols <= encoding.MAX_STRUCTURED_APPEND:
+        raise ValueError("The number of symbols must be between 1 and {:d}".format(encoding.MAX_STRUCTURED_APPEND))
+    if not 1 <= max_version <= 40:
+        raise ValueError("The maximum version must be between 1 and 40")
+
+    ec = EC_LEVEL[ec_level] if type(ec_level) is str else ec_level  # Cast to enum if needed
+    message = encoding.as_payload(message)
+    cuts = _plan(message, ec, max_symbols, max_version, objective)
+    parity = encoding.structured_append_parity(message)
+    return [(message[start:end], (index, len(cuts), parity)) for index, (start, end) in enumerate(cuts)]
+
+
+def _generate_part(part: Union[str, bytes], header: Tuple[int, int, int], ec_level: Union[EC_LEVEL, str], output: str,
+                   options: dict):
+    code = QRImage(None, ec_level, part, structured_append=header, **options)
+    if output == "image":
+        return code.get_image()
+    return code.get_matrix().copy()
+
+
+def tile(matrices: List[numpy.ndarray], columns: Optional[int] = None, spacing: int = 4) -> numpy.ndarray:
+    """
+    Places symbols on a grid in reading order, each in a cell the size of the largest symbol
+
+    :param matrices: The module matrices of the symbols, 1 for dark modules
+    :param columns: The number of symbols per row, by default the grid is as square as possible
+    :param spacing: The width of the light gap around the symbols, in modules. Readers need 4
+    :return: The module matrix of the composite
+    """
+    columns = columns or math.ceil(math.sqrt(len(matrices)))
+    rows = math.ceil(len(matrices) / columns)
+    cell = max(matrix.shape[0] for matrix in matrices) + spacing
+    composite = numpy.zeros((rows * cell + spacing, columns * cell + spacing), dtype=numpy.uint8)
+    for i, matrix in enumerate(matrices):
+        y = spacing + i // columns * cell
+        x = spacing + i % columns * cell
+        composite[y:y + matrix.shape[0], x:x + matrix.shape[1]] = matrix
+    return composite
+
+
+def generate_structured(message: encoding.Message, ec_level: Union[EC_LEVEL, str] = EC_LEVEL.L,
+                        max_symbols: int = encoding.MAX_STRUCTURED_APPEND, objective: str = "modules",
+                        max_version: int = 40, workers: Optional[int] = None, output: str = "matrix",
+                        composite: bool = False, columns: Optional[int] = None, spacing: int = 4,
+                        **options) -> Union[list, numpy.ndarray, Image.Image]:
+    """
+    Generates the symbols of a Structured Append message, in parallel
+
+    :param message: The message to encode, text or a binary payload
+    :param ec_level: The error correction level of the symbols
+    :param max_symbols: The maximum number of symbols, at most 16
+    :param objective: How the message is split, see split_message
+    :param max_version: The largest version a symbol can use
+    :param workers: The number of worker processes, defaults to the number of CPUs. 1 generates in this process
+    :param output: "matrix" for the module matrices as uint8 arrays, "image" for PIL images
+    :param composite: If True, return a single matrix or image with the symbols on a grid instead of a list
+    :param columns: The number of symbols per row of the composite
+    :param spacing: The width of the light gap around the symbols of the composite, in modules. The quiet_zone option
+    adds a light border around the whole composite image
+    :param options: Other arguments passed to QRImage (mask, mask_policy, module_size, quiet_zone, ...)
+    :raise encoding.EncodingError: if the message can't be encoded
+    :raise ValueError: if the message doesn't fit in max_symbols symbols of at most max_version
+    :return: The symbols in order, or the composite
+    """
+    if output not in OUTPUTS:
+        raise ValueError("Unknown output, must be one of " + ", ".join(OUTPUTS))
+
+    parts = split_message(message, ec_level, max_symbols, objective, max_version)
+    # The composite is tiled from the matrices, the symbols are only rendered once
+    part_output = "matrix" if composite else output
+    arguments = [(part, header, ec_level, part_output, options) for part, header in parts]
+
+    workers = min(workers or os.cpu_count() or 1, len(parts))
+    if workers == 1:
+        results = [_generate_part(*args) for args in arguments]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_generate_part, *zip(*arguments)))
+
+    if not composite:
+        return results
+    grid = tile(results, columns, spacing)
+    if output == "matrix":
+        return grid
+
+    # Rendered like the image of a single symbol, with its quiet zone around the whole grid
+    from PIL import Image
+    module_size = options.get("module_size", 20)
+    grid = numpy.pad(grid, options.get("quiet_zone", 0))
+    if options.get("image_mode", "L") == "1":
+        height, width = grid.shape
+        return Image.fromarray(grid == 0).resize((width * module_size, height * module_size), Image.NEAREST)
+    pixels = ((1 - grid) * 255).astype(numpy.uint8).repeat(module_size, axis=0).repeat(module_size, axis=1)
+    return Image.fromarray(pixels, "L")
@@ -0,0 +1,18 @@
+import batch
+
+
+def test_unordered_results_with_a_bounded_window():
+    messages = ["message {:d}".format(i) for i in range(20)] + [42]
+    expected = batch.generate_many(messages, version=2, workers=1)
+    results = dict(batch.generate_many(messages, version=2, workers=2, ordered=False, chunk_size=2,
+                                       max_chunks_in_flight=1))
+    assert sorted(results) == list(range(21))
+    for index, matrix in enumerate(expected[:-1]):
+        assert (results[index] == matrix).all()
+    assert isinstance(results[20], batch.GenerationError) and results[20].index == 20
+
+
+def test_failed_chunks_are_reported_per_message():
+    # The options can't be sent to the workers, so every chunk fails as a whole
+    results = batch.generate_many(["A", "B", "C"], workers=2, chunk_size=2, unpicklable=lambda: None)
+    assert [(result.index, type(result)) for result in results] == [(i, batch.GenerationError) for i in range(3)]
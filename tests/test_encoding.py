@@ -0,0 +1,30 @@
+from bitstream import BitStream
+from constants import DATA_MODE
+import encoding
+
+
+def test_alphanumeric_dollar_sign():
+    assert encoding.encode("$", DATA_MODE.Alphanumeric) == [37]
+    assert encoding.encode("A$ %*+-./:", DATA_MODE.Alphanumeric) == [10, 37, 36, 38, 39, 40, 41, 42, 43, 44]
+
+
+def _numeric_stream(digits: str) -> BitStream:
+    stream = BitStream()
+    encoding._append_data(stream, encoding.encode(digits, DATA_MODE.Numeric), DATA_MODE.Numeric)
+    return stream
+
+
+def test_numeric_groups_keep_leading_zeros():
+    # Groups of 3, 2 and 1 digits take 10, 7 and 4 bits whatever their value
+    assert len(_numeric_stream("007")) == 10
+    assert len(_numeric_stream("00705")) == 17
+    assert len(_numeric_stream("0070")) == 14
+    assert _numeric_stream("007").to_bytes() == bytes([0b00000001, 0b11000000])
+
+
+def test_kanji_text_can_use_mixed_utf8_runs():
+    # Numeric then UTF-8 byte runs after an ECI segment are shorter than any kanji/byte split here
+    ranges, charset = encoding.segment_ranges("4649漢a6漢 ", 1)
+    assert charset == "utf-8"
+    assert ranges == [(DATA_MODE.Numeric, 0, 4), (DATA_MODE.Byte, 4, 9)]
+    assert encoding._segments_bit_length(encoding.segment_data("4649漢a6漢 ", 1), 1) == 124
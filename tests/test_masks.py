@@ -0,0 +1,57 @@
+import numpy
+
+import bitboard
+import image
+import penalty
+from image import QRImage
+from matrix import MaskSearchStats, search_masks
+
+
+def _candidates():
+    # The 8 masked candidates of real symbols, and random matrices for patterns that symbols rarely hold
+    generator = numpy.random.RandomState(0)
+    for version in [1, 4, 10]:
+        code = QRImage(version, "M", "mask {:d}".format(version), use_cache=False)
+        yield code, code._mask_candidates()
+        size = version * 4 + 17
+        yield code, (generator.rand(4, size, size) < generator.rand(4, 1, 1)).astype(numpy.uint8)
+
+
+def test_penalty_engine_matches_the_reference():
+    for code, candidates in _candidates():
+        scores = penalty.penalty_scores(candidates)
+        assert list(scores.sum(axis=1)) == [code._calculate_mask_score(candidate.tolist()) for candidate in candidates]
+        for rule in range(4):
+            assert list(penalty.rule_scores(candidates, rule)) == list(scores[:, rule])
+
+
+def test_bitboards_match_the_penalty_engine():
+    for code, candidates in _candidates():
+        scores = penalty.penalty_scores(candidates)
+        size = candidates.shape[1]
+        for candidate, expected in zip(candidates, scores):
+            rows, cols = bitboard.from_modules(candidate.tobytes(), size)
+            assert bitboard.penalty_scores(rows, cols, size) == tuple(expected)
+            assert [bitboard.rule_score(rows, cols, size, rule) for rule in range(4)] == list(expected)
+        bitboard_code = QRImage(code.get_version(), "M", code.get_message(), score_backend="bitboard", use_cache=False)
+        assert bitboard_code.get_mask() == code.get_mask()
+
+
+def test_branch_and_bound_matches_the_exhaustive_search():
+    for version in [2, 10, 25]:
+        for i in range(3):
+            code = QRImage(version, "L", "search {:d}".format(i), use_cache=False)
+            candidates = code._mask_candidates()
+            scores = penalty.penalty_scores(candidates).sum(axis=1)
+            stats = MaskSearchStats()
+            mask, score = search_masks(image._candidate_score_rule(candidates), stats)
+            assert (mask, score) == (int(scores.argmin()), int(scores.min()))
+            assert stats.evaluated_rules + stats.skipped_rules == 32
+            assert code.get_mask() == mask
+
+    # Random score tables, with many ties: the lowest mask number wins
+    generator = numpy.random.RandomState(1)
+    for _ in range(200):
+        table = generator.randint(0, 4, (8, 4)) * 10
+        mask, score = search_masks(lambda indexes, rule: [table[i][rule] for i in indexes], MaskSearchStats())
+        assert (mask, score) == (int(table.sum(axis=1).argmin()), int(table.sum(axis=1).min()))
@@ -0,0 +1,33 @@
+import pytest
+
+import pipeline
+
+
+def test_failed_chunks_are_reported_per_item():
+    written = []
+    # The options can't be sent to the workers, so every chunk fails as a whole
+    stats = pipeline.run_pipeline(["A", "B", ("key", "C")], lambda key, png: written.append(key), workers=2,
+                                  chunk_size=1, unpicklable=lambda: None)
+    assert written == []
+    assert [key for key, _ in stats.errors] == ["0", "1", "key"]
+    assert [error.index for _, error in stats.errors] == [0, 1, 2]
+
+
+def test_errors_carry_the_position_of_the_item():
+    stats = pipeline.run_pipeline(["A", 42, "B"], lambda key, png: None, version=1)
+    assert [(key, error.index) for key, error in stats.errors] == [("1", 1)]
+    assert stats.items == 2
+
+
+def test_sink_errors_are_raised():
+    for workers in (1, 2):
+        written = []
+
+        def sink(key, png):
+            if written:
+                raise OSError("disk full")
+            written.append(key)
+
+        with pytest.raises(OSError, match="disk full"):
+            pipeline.run_pipeline(["A", "B", "C"], sink, version=1, workers=workers, chunk_size=3)
+        assert written == ["0"]
@@ -0,0 +1,38 @@
+import numpy
+
+import image
+import matrix
+
+
+def _zigzag(version: int):
+    # Placement of 7.7.3: 2-module wide columns from the right, alternately upwards and downwards, skipping the
+    # vertical timing pattern and every function module
+    size = version * 4 + 17
+    template = matrix.draw_function_patterns(version)
+    order = []
+    upward = True
+    right = size - 1
+    while right > 0:
+        if right == 6:
+            right = 5
+        for y in (range(size - 1, -1, -1) if upward else range(size)):
+            order.extend(y * size + x for x in (right, right - 1) if template[y][x] == -1)
+        upward = not upward
+        right -= 2
+    return order
+
+
+def test_placement_index_follows_the_zigzag():
+    for version in [1, 2, 6, 7, 14, 27, 40]:
+        order = _zigzag(version)
+        assert matrix.placement_order(version) == order
+        rows, cols = image._placement_index(version)
+        assert list(rows * (version * 4 + 17) + cols) == order
+
+
+def test_codewords_are_written_in_placement_order():
+    for version in [1, 7, 21]:
+        code = image.QRImage(version, "M", "placement", use_cache=False)
+        code.get_matrix()
+        bits = numpy.unpackbits(numpy.frombuffer(code._data, dtype=numpy.uint8))
+        assert (code._unmasked.ravel()[_zigzag(version)[:len(bits)]] == bits).all()
@@ -0,0 +1,36 @@
+import random
+
+import numpy
+
+from constants import EC_LEVEL
+import encoding
+import rs
+
+
+def _blocks(count: int, length: int, seed: int):
+    generator = random.Random(seed)
+    return [bytes(generator.randrange(256) for _ in range(length)) for _ in range(count)]
+
+
+def test_lfsr_matches_the_reference():
+    # EC codewords per block used by the standard, and a long block
+    for ecc_amount, length in [(7, 19), (10, 16), (18, 43), (26, 24), (30, 15), (30, 16), (68, 120)]:
+        for block in _blocks(5, length, ecc_amount) + [bytes(length), bytes([255] * length)]:
+            assert rs.create_ecc_block(block, ecc_amount) == rs.create_ecc_block_reference(block, ecc_amount)
+
+
+def test_batch_matches_the_reference():
+    for ecc_amount, length in [(7, 19), (22, 15), (30, 16)]:
+        blocks = _blocks(6, length, length)
+        ecc = rs.create_ecc_blocks(numpy.array([list(block) for block in blocks], dtype=numpy.uint8), ecc_amount)
+        assert ecc.dtype == numpy.uint8
+        assert [bytes(row) for row in ecc] == [rs.create_ecc_block_reference(block, ecc_amount) for block in blocks]
+
+
+def test_codeword_batch_matches_single_messages():
+    messages = ["https://example.com/item/{:04d}".format(i) for i in range(5)] + ["", "ÉCHO", b"\x00\xff", "x" * 32]
+    # "x" * 32 fills 2-L without padding codewords
+    for version, ec in [(2, EC_LEVEL.L), (5, EC_LEVEL.Q), (10, EC_LEVEL.H)]:
+        batch = encoding.generate_codewords_batch(messages, version, ec)
+        assert [bytes(row) for row in batch] == [bytes(encoding.generate_codewords(message, version, ec))
+                                                 for message in messages]
@@ -0,0 +1,44 @@
+import random
+
+import numpy
+
+from constants import EC_LEVEL
+import encoding
+import structured
+
+
+def _part_versions(parts, ec_level):
+    return [encoding.select_version(part, ec_level, structured_append=header)[0] for part, header in parts]
+
+
+def test_parts_fit_the_maximum_version():
+    # Parts are segmented again when encoded, with another charset than the whole message for some of them
+    message = ("écE字8c6PbNaKIGQYPDX50IIJbO漢漢S9Yc3KQ0FDJPXLL2WV8漢漢字5KRFAS2PK06b0字"
+               "LaX日JZP本O漢EWZ0漢O9日漢HZIGRbb3R")
+    parts = structured.split_message(message, "L", objective="version", max_version=1)
+    assert "".join(part for part, _ in parts) == message
+    assert max(_part_versions(parts, EC_LEVEL.L)) == 1
+
+    generator = random.Random(0)
+    for _ in range(20):
+        length = generator.randint(1, 600)
+        message = "".join(generator.choice("0123456789ABCabc .é本日漢字") for _ in range(length))
+        max_version = generator.randint(1, 6)
+        for objective in structured.OBJECTIVES:
+            try:
+                parts = structured.split_message(message, "M", objective=objective, max_version=max_version)
+            except ValueError:
+                continue
+            assert "".join(part for part, _ in parts) == message
+            assert max(_part_versions(parts, EC_LEVEL.M)) <= max_version
+
+
+def test_composite_image_uses_the_image_options():
+    message = "structured append " * 20
+    grid = structured.generate_structured(message, "M", max_version=3, workers=1, composite=True)
+    image = structured.generate_structured(message, "M", max_version=3, workers=1, output="image", composite=True,
+                                           module_size=2, quiet_zone=3, image_mode="1")
+    assert image.mode == "1"
+    assert image.size == ((grid.shape[1] + 6) * 2, (grid.shape[0] + 6) * 2)
+    light = numpy.pad(grid, 3).repeat(2, axis=0).repeat(2, axis=1) == 0
+    assert (numpy.asarray(image) == light).all()
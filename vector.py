@@ -0,0 +1,112 @@
+"""
+SVG and PDF output for QR codes, using only the standard library.
+
+Dark modules are drawn as one rectangle per horizontal run, all in a single path, which keeps the output small and
+fast to render even for version 40. Documents are written row by row to the output, nothing is built in memory.
+"""
+import re
+import zlib
+from typing import BinaryIO, Iterable, List, Sequence, TextIO, Tuple
+
+_DARK_RUN = re.compile(b"\x01+")
+
+
+def _runs(matrix: Iterable[Sequence[int]]) -> Iterable[Tuple[int, List[Tuple[int, int]]]]:
+    """
+    Yields (row, runs) for every row, runs holds the (column, length) of every horizontal run of dark modules
+    """
+    for y, row in enumerate(matrix):
+        yield y, [(run.start(), run.end() - run.start()) for run in _DARK_RUN.finditer(bytes(row))]
+
+
+def write_svg(output: TextIO, matrix: Iterable[Sequence[int]], size: int, module_size: float = 1,
+              quiet_zone: int = 4) -> int:
+    """
+    Writes a QR code as an SVG image. Coordinates are in modules, module_size only sets the size of the image
+
+    :param output: A text file-like object, only write() is used
+    :param matrix: The rows of modules (1 for dark modules), read one at a time
+    :param size: The number of modules in a row
+    :param module_size: The width of a module in pixels
+    :param quiet_zone: The width of the light border around the code, in modules
+    :return: The number of characters written
+    """
+    width = size + 2 * quiet_zone
+    written = output.write(
+        '<svg xmlns="http://www.w3.org/2000/svg" width="{0:g}" height="{0:g}" viewBox="0 0 {1:d} {1:d}" '
+        'shape-rendering="crispEdges"><rect width="{1:d}" height="{1:d}" fill="#fff"/><path fill="#000" d="'.format(
+            width * module_size, width))
+    # Moves are relative to the start of the previous run (where z leaves the pen), which keeps the numbers short. A
+    # first relative move is relative to the origin
+    previous_x, previous_y = -quiet_zone, -quiet_zone
+    for y, runs in _runs(matrix):
+        if not runs:
+            continue
+        path = []
+        for x, length in runs:
+            path.append("m{:d} {:d}h{:d}v1h-{:d}z".format(x - previous_x, y - previous_y, length, length))
+            previous_x, previous_y = x, y
+        written += output.write("".join(path))
+    written += output.write('"/></svg>\n')
+    return written
+
+
+def write_pdf(output: BinaryIO, matrix: Iterable[Sequence[int]], size: int, module_size: float = 1,
+              quiet_zone: int = 4, compression: int = 6) -> int:
+    """
+    Writes a QR code as a single page PDF document, the page is the size of the code
+
+    :param output: A binary file-like object, only write() is used so pipes and sockets work too
+    :param matrix: The rows of modules (1 for dark modules), read one at a time
+    :param size: The number of modules in a row
+    :param module_size: The width of a module in points (1/72 inch)
+    :param quiet_zone: The width of the light border around the code, in modules
+    :param compression: The zlib compression level of the page content
+    :return: The number of bytes written
+    """
+    width = size + 2 * quiet_zone
+    offsets = []  # byte offset of every object, for the cross-reference table
+    written = 0
+
+    def write(data: bytes):
+        nonlocal written
+        output.write(data)
+        written += len(data)
+
+    def begin_object():
+        offsets.append(written)
+        write("{:d} 0 obj\n".format(len(offsets)).encode())
+
+    write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    begin_object()
+    write(b"<< /Type /Catalog /Pages 2 0 R >>\nendobj\n")
+    begin_object()
+    write(b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>\nendobj\n")
+    begin_object()
+    write("<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {0:g} {0:g}] /Resources << >> /Contents 4 0 R >>\n"
+          "endobj\n".format(width * module_size).encode())
+
+    # The length of the content isn't known before it is compressed, it is written as a separate object afterwards
+    begin_object()
+    write(b"<< /Length 5 0 R /Filter /FlateDecode >>\nstream\n")
+    compressor = zlib.compressobj(compression)
+    stream_start = written
+    # Scale to module units, PDF rows go up so flip the y axis
+    write(compressor.compress("{0:g} 0 0 {0:g} 0 0 cm 0 g\n".format(module_size).encode()))
+    for y, runs in _runs(matrix):
+        bottom = width - quiet_zone - y - 1
+        write(compressor.compress("".join(
+            "{:d} {:d} {:d} 1 re\n".format(x + quiet_zone, bottom, length) for x, length in runs).encode()))
+    write(compressor.compress(b"f\n"))
+    write(compressor.flush())
+    stream_length = written - stream_start
+    write(b"\nendstream\nendobj\n")
+    begin_object()
+    write("{:d}\nendobj\n".format(stream_length).encode())
+
+    xref = written
+    write("xref\n0 {:d}\n0000000000 65535 f \n".format(len(offsets) + 1).encode())
+    for offset in offsets:
+        write("{:010d} 00000 n \n".format(offset).encode())
+    write("trailer\n<< /Size {:d} /Root 1 0 R >>\nstartxref\n{:d}\n%%EOF\n".format(len(offsets) + 1, xref).encode())
+    return written